@@ -0,0 +1,195 @@
+"""
+VisionEstate - Analysis Jobs
+Persistent background jobs for property analysis with per-photo and per-stage progress.
+"""
+
+import os
+import json
+import uuid
+from datetime import datetime
+from enum import Enum
+
+from models import get_db
+
+# Stages every analysis job goes through, in order. Gemini verification runs in the background
+# once the results are saved, so it may still be queued or running when the job completes.
+JOB_STAGES = ["detection", "saving", "gemini_verification"]
+
+
+class AnalysisJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+ACTIVE_STATUSES = (AnalysisJobStatus.QUEUED.value, AnalysisJobStatus.RUNNING.value)
+
+
+def create_job(property_id: int, photos: list, previous_status: str) -> str:
+    """Persist a queued job and return its id"""
+    job_id = str(uuid.uuid4())
+    progress = {
+        "stage": None,
+        "stages": {stage: "pending" for stage in JOB_STAGES},
+        "photos": [{"photo": photo, "status": "pending"} for photo in photos],
+    }
+    now = datetime.now().isoformat()
+
+    conn = get_db()
+    conn.execute("""
+        INSERT INTO analysis_jobs (
+            id, property_id, status, previous_status, photos_total, progress, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        job_id, property_id, AnalysisJobStatus.QUEUED.value, previous_status,
+        len(photos), json.dumps(progress), now, now
+    ))
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def get_job(job_id: str):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return _row_to_job(row) if row else None
+
+
+def get_active_job(property_id: int):
+    """The queued or running job for a property, if any"""
+    conn = get_db()
+    row = conn.execute(f"""
+        SELECT * FROM analysis_jobs
+        WHERE property_id = ? AND status IN ({",".join("?" * len(ACTIVE_STATUSES))})
+        ORDER BY created_at DESC LIMIT 1
+    """, (property_id, *ACTIVE_STATUSES)).fetchone()
+    conn.close()
+    return _row_to_job(row) if row else None
+
+
+def _process_alive(pid) -> bool:
+    if pid is None or pid == os.getpid():
+        # Unclaimed, or claimed by an earlier process that had this server's pid
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def list_interrupted_jobs() -> list:
+    """
+    (job id, worker pid) of jobs left queued or running by a server process that is gone,
+    oldest first. With several server workers every one of them sees the same jobs, so each
+    must still win claim_job before running one.
+    """
+    conn = get_db()
+    rows = conn.execute(f"""
+        SELECT id, worker_pid FROM analysis_jobs
+        WHERE status IN ({",".join("?" * len(ACTIVE_STATUSES))})
+        ORDER BY created_at
+    """, ACTIVE_STATUSES).fetchall()
+    conn.close()
+    return [(row["id"], row["worker_pid"]) for row in rows if not _process_alive(row["worker_pid"])]
+
+
+def claim_job(job_id: str, previous_pid: int = None) -> bool:
+    """
+    Atomically mark a job running in this process. Only succeeds while the job is still
+    active and owned by previous_pid (None for a job no process has started), so of several
+    server workers trying to run the same job exactly one gets it.
+    """
+    now = datetime.now().isoformat()
+    conn = get_db()
+    claimed = conn.execute(f"""
+        UPDATE analysis_jobs SET status = ?, worker_pid = ?, started_at = ?, updated_at = ?
+        WHERE id = ? AND worker_pid IS ? AND status IN ({",".join("?" * len(ACTIVE_STATUSES))})
+    """, (
+        AnalysisJobStatus.RUNNING.value, os.getpid(), now, now, job_id, previous_pid, *ACTIVE_STATUSES
+    )).rowcount
+    conn.commit()
+    conn.close()
+    return claimed == 1
+
+
+def mark_completed(job_id: str, result: dict):
+    _update(
+        job_id,
+        status=AnalysisJobStatus.COMPLETED.value,
+        result=json.dumps(result),
+        finished_at=datetime.now().isoformat(),
+    )
+
+
+def mark_failed(job_id: str, error: str):
+    _update(
+        job_id,
+        status=AnalysisJobStatus.FAILED.value,
+        error=error,
+        finished_at=datetime.now().isoformat(),
+    )
+
+
+class JobProgress:
+    """Records stage and per-photo progress of a running job"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        job = get_job(job_id)
+        self.progress = job["progress"]
+
+    def start_stage(self, stage: str):
+        self.progress["stage"] = stage
+        self.progress["stages"][stage] = "running"
+        self._save()
+
+    def finish_stage(self, stage: str, status: str = "done"):
+        self.progress["stages"][stage] = status
+        self._save()
+
+    def set_photos(self, indices: list, status: str, details: list = None):
+        for n, i in enumerate(indices):
+            self.progress["photos"][i]["status"] = status
+            if details is not None:
+                self.progress["photos"][i].update(details[n])
+        self._save(photos_done=sum(
+            1 for p in self.progress["photos"] if p["status"] in ("done", "missing")
+        ))
+
+    def _save(self, **fields):
+        _update(self.job_id, progress=json.dumps(self.progress), **fields)
+
+
+def _update(job_id: str, **fields):
+    fields["updated_at"] = datetime.now().isoformat()
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    conn = get_db()
+    conn.execute(
+        f"UPDATE analysis_jobs SET {assignments} WHERE id = ?",
+        (*fields.values(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _row_to_job(row) -> dict:
+    return {
+        "job_id": row["id"],
+        "property_id": row["property_id"],
+        "status": row["status"],
+        "previous_status": row["previous_status"],
+        "photos_total": row["photos_total"],
+        "photos_done": row["photos_done"],
+        "progress": json.loads(row["progress"]) if row["progress"] else {},
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+        "updated_at": row["updated_at"],
+    }
@@ -1,27 +1,29 @@
 import cv2
 import torch
 import numpy as np
-from ultralytics import YOLO
 import os
+import time
+import hashlib
+import json
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
-# Room type detection (CLIP/ViT zero-shot)
-from transformers import CLIPProcessor, CLIPModel
+import model_registry
+import result_cache
+import image_io
+import micro_batcher
+from detections import Detections, FLAG_CRACK, FLAG_CALIBRATION
+from calibration import locate_a4, calibration_config, A4_REFINE_BELOW_PX
 
-# Floor segmentation (ADE20K, SegFormer)
-from transformers import SegformerFeatureExtractor, SegformerForSemanticSegmentation
+# Bump whenever a change alters analyzer output, so cached results from older code are not reused
+ANALYZER_VERSION = "5"
 
-# Load SegFormer model for ADE20K segmentation (only once)
-segformer_processor = SegformerFeatureExtractor.from_pretrained(
-    "nvidia/segformer-b0-finetuned-ade-512-512")
-segformer_model = SegformerForSemanticSegmentation.from_pretrained(
-    "nvidia/segformer-b0-finetuned-ade-512-512")
-
-# Load CLIP model for room type detection (only once)
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch16")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch16")
+# Maximum number of photos stacked into one forward pass per model
+ANALYZER_BATCH_SIZE = int(os.getenv("ANALYZER_BATCH_SIZE", "8"))
 
 # Room type labels for zero-shot
-ROOM_TYPE_LABELS = [
+DEFAULT_ROOM_TYPE_LABELS = [
     "a bedroom",
     "a living room",
     "a kitchen",
@@ -29,6 +31,55 @@ ROOM_TYPE_LABELS = [
     "an office"
 ]
 
+EXTENDED_ROOM_TYPE_LABELS = DEFAULT_ROOM_TYPE_LABELS + [
+    "a studio apartment",
+    "a dining room",
+    "a balcony",
+    "a hallway",
+    "a laundry room",
+    "a storage room",
+    "a garage",
+    "a staircase",
+]
+
+# ROOM_TYPE_LABELS env: "default", "extended", or a comma-separated list of prompts
+_room_labels_env = os.getenv("ROOM_TYPE_LABELS", "default").strip()
+if _room_labels_env == "default":
+    ROOM_TYPE_LABELS = DEFAULT_ROOM_TYPE_LABELS
+elif _room_labels_env == "extended":
+    ROOM_TYPE_LABELS = EXTENDED_ROOM_TYPE_LABELS
+else:
+    ROOM_TYPE_LABELS = [label.strip() for label in _room_labels_env.split(",") if label.strip()]
+
+# Cascade mode: a cheap first pass (low-resolution crack YOLO + CLIP scene check) decides
+# which expensive stages run on each photo
+ANALYZER_CASCADE = os.getenv("ANALYZER_CASCADE", "0") == "1"
+# 0 never skips anything, 1 prunes whenever the first pass leans towards "nothing to find"
+ANALYZER_CASCADE_AGGRESSIVENESS = float(os.getenv("ANALYZER_CASCADE_AGGRESSIVENESS", "0.5"))
+# Letterbox size of the crack pre-screen
+ANALYZER_CASCADE_PRESCREEN_SIZE = int(os.getenv("ANALYZER_CASCADE_PRESCREEN_SIZE", "320"))
+
+# Tiled crack detection: large photos are also searched in overlapping full-detail tiles, so
+# hairline cracks survive instead of being downscaled to the network's input size (0/1)
+ANALYZER_CRACK_TILING = os.getenv("ANALYZER_CRACK_TILING", "0") == "1"
+# Tiles are cut from the photo decoded at this long side at most, which caps memory per photo
+ANALYZER_CRACK_TILE_MAX_SIDE = int(os.getenv("ANALYZER_CRACK_TILE_MAX_SIDE", "4096"))
+# Fraction of a tile shared with its neighbour
+ANALYZER_CRACK_TILE_OVERLAP = float(os.getenv("ANALYZER_CRACK_TILE_OVERLAP", "0.2"))
+# Tiles per forward pass, and forward passes running in parallel
+ANALYZER_CRACK_TILE_BATCH = int(os.getenv("ANALYZER_CRACK_TILE_BATCH", "4"))
+ANALYZER_CRACK_TILE_WORKERS = int(os.getenv("ANALYZER_CRACK_TILE_WORKERS", "2"))
+
+# Zero-shot prompts for the cascade scene check; the first one is the interior prompt
+SCENE_LABELS = [
+    "a photo of the inside of a room",
+    "a photo of the outside of a building",
+    "an outdoor photo of a garden or street",
+]
+
+# Optional directory for persisting CLIP text embeddings between restarts
+CLIP_TEXT_CACHE_DIR = os.getenv("CLIP_TEXT_CACHE_DIR", "")
+
 # Reference object dimensions in meters (width, height) - using typical sizes
 # These are used to estimate scale when detected in images
 REFERENCE_OBJECTS = {
@@ -52,107 +103,142 @@ AVERAGE_ROOM_SIZES = {
     "kitchen": {"small": 8, "medium": 12, "large": 18},
     "bathroom": {"small": 4, "medium": 6, "large": 10},
     "office": {"small": 9, "medium": 14, "large": 20},
+    "studio apartment": {"small": 20, "medium": 30, "large": 45},
+    "dining room": {"small": 9, "medium": 14, "large": 20},
+    "balcony": {"small": 3, "medium": 5, "large": 9},
+    "hallway": {"small": 3, "medium": 5, "large": 8},
+    "laundry room": {"small": 3, "medium": 5, "large": 8},
+    "storage room": {"small": 2, "medium": 4, "large": 8},
+    "garage": {"small": 15, "medium": 20, "large": 35},
+    "staircase": {"small": 4, "medium": 6, "large": 10},
 }
 
-# Load Vision Models
-obj_model = YOLO('yolov8n.pt')
-crack_model = YOLO('crack.pt')
 
-# Load MiDaS for Depth
-model_type = "MiDaS_small"
-device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-midas = torch.hub.load("intel-isl/MiDaS", model_type, trust_repo=True).to(device).eval()
-midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
+def _reference_table(labels):
+    """Per-label (width, height, priority) of the first REFERENCE_OBJECTS entry the label contains"""
+    table = np.full((len(labels), 3), np.inf)
+    names = [None] * len(labels)
+    for i, label in enumerate(labels):
+        label = label.lower()
+        for ref_name, ref_data in REFERENCE_OBJECTS.items():
+            if ref_name in label:
+                table[i] = ref_data["width"], ref_data["height"], ref_data["priority"]
+                names[i] = ref_name
+                break
+    return table, names
 
 
-def find_a4_calibration(img):
+def estimate_scale_from_reference_objects(detections, img_width, img_height):
     """
-    Detects ONLY the A4 sheet by verifying it is a 4-sided polygon 
-    with a specific aspect ratio (~1.41).
+    Estimate meters-per-pixel using detected reference objects.
+    Returns (m_per_px, reference_object_used, confidence)
     """
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.bilateralFilter(gray, 9, 75, 75)
-    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
-    kernel = np.ones((5, 5), np.uint8)
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    candidates = []
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < 3000:
-            continue
+    if not len(detections):
+        return None, None, 0.0
 
-        peri = cv2.arcLength(cnt, True)
-        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+    table, names = _reference_table(detections.labels)
+    ref = table[detections.class_ids]
+    widths, heights = detections.boxes[:, 2], detections.boxes[:, 3]
+    usable = np.isfinite(ref[:, 2]) & (widths > 0) & (heights > 0)
+    if not usable.any():
+        return None, None, 0.0
 
-        if len(approx) == 4:
-            rect = cv2.minAreaRect(cnt)
-            (cx, cy), (rw, rh), angle = rect
-            if min(rw, rh) == 0:
-                continue
+    # Highest priority (lowest number) wins; the first such box on ties
+    best = int(np.argmin(np.where(usable, ref[:, 2], np.inf)))
+    ref_width, ref_height, priority = ref[best]
+    # Use the larger dimension for more reliable estimation
+    if widths[best] > heights[best]:
+        m_per_px = ref_width / widths[best]
+    else:
+        m_per_px = ref_height / heights[best]
 
-            aspect = max(rw, rh) / min(rw, rh)
-            if 1.2 < aspect < 1.7:
-                score = 1.0 - abs(aspect - 1.414)
-                candidates.append({'approx': approx, 'score': score, 'rect': rect})
+    # Confidence based on priority (1 = highest confidence)
+    confidence = max(0.5, 1.0 - (priority - 1) * 0.1)
+    return float(m_per_px), names[detections.class_ids[best]], float(confidence)
 
-    if not candidates:
-        return None, None
 
-    best = max(candidates, key=lambda x: x['score'])
-    rect = best['rect']
-    pixel_length = max(rect[1])
-    m_per_px = 0.297 / pixel_length
+def room_type_name(label):
+    """'a living room' -> 'Living Room'"""
+    words = label.strip().split()
+    if words and words[0].lower() in ("a", "an", "the"):
+        words = words[1:]
+    return " ".join(words).title()
 
-    x, y, w, h = cv2.boundingRect(best['approx'])
-    return float(m_per_px), [float(x), float(y), float(w), float(h)]
 
+_text_embeddings = {}
+_text_embeddings_lock = threading.Lock()
 
-def estimate_scale_from_reference_objects(detections, img_width, img_height):
+
+def _clip_revision(clip_model):
+    """Identify the loaded CLIP weights so cached text embeddings are never reused across models"""
+    revision = getattr(clip_model.config, "_commit_hash", None) or model_registry.CLIP_CHECKPOINT
+    precision = model_registry.loaded_precision("clip")
+    return revision if precision == "fp32" else f"{revision}-{precision}"
+
+
+def get_room_text_embeddings(labels=None):
     """
-    Estimate meters-per-pixel using detected reference objects.
-    Returns (m_per_px, reference_object_used, confidence)
+    L2-normalised CLIP text embeddings for the room type prompts.
+
+    The prompts never change between photos, so the text tower runs once per
+    (model revision, label list) and the result is kept in memory and, when
+    CLIP_TEXT_CACHE_DIR is set, on disk.
     """
-    best_reference = None
-    best_priority = 999
-    best_m_per_px = None
-    
-    for det in detections:
-        label = det.get("label", "").lower()
-        bbox = det.get("bbox", [])
-        
-        if len(bbox) < 4:
-            continue
-            
-        # Check if this object is a known reference
-        for ref_name, ref_data in REFERENCE_OBJECTS.items():
-            if ref_name in label:
-                bbox_width_px = bbox[2]  # width in pixels
-                bbox_height_px = bbox[3]  # height in pixels
-                
-                # Use the larger dimension for more reliable estimation
-                if bbox_width_px > bbox_height_px:
-                    # Object appears wider - use width for scale
-                    m_per_px = ref_data["width"] / bbox_width_px
-                else:
-                    # Object appears taller - use height for scale
-                    m_per_px = ref_data["height"] / bbox_height_px
-                
-                # Check if this is a better (higher priority) reference
-                if ref_data["priority"] < best_priority:
-                    best_priority = ref_data["priority"]
-                    best_reference = ref_name
-                    best_m_per_px = m_per_px
-                break
-    
-    if best_m_per_px is not None:
-        # Confidence based on priority (1 = highest confidence)
-        confidence = max(0.5, 1.0 - (best_priority - 1) * 0.1)
-        return best_m_per_px, best_reference, confidence
-    
-    return None, None, 0.0
+    labels = tuple(labels or ROOM_TYPE_LABELS)
+    clip_model = model_registry.get("clip")
+    key = (_clip_revision(clip_model), labels)
+
+    embeddings = _text_embeddings.get(key)
+    if embeddings is not None:
+        return embeddings
+
+    with _text_embeddings_lock:
+        if key in _text_embeddings:
+            return _text_embeddings[key]
+
+        cache_path = None
+        if CLIP_TEXT_CACHE_DIR:
+            digest = hashlib.sha256(json.dumps([key[0], list(labels)]).encode()).hexdigest()[:16]
+            cache_path = os.path.join(CLIP_TEXT_CACHE_DIR, f"clip_text_{digest}.npy")
+
+        if cache_path and os.path.exists(cache_path):
+            embeddings = torch.from_numpy(np.load(cache_path))
+        else:
+            clip_processor = model_registry.get("clip_processor")
+            text_inputs = clip_processor(text=list(labels), return_tensors="pt", padding=True)
+            with torch.no_grad(), model_registry.autocast("clip"):
+                embeddings = clip_model.get_text_features(**text_inputs).float()
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+            if cache_path:
+                os.makedirs(CLIP_TEXT_CACHE_DIR, exist_ok=True)
+                np.save(cache_path, embeddings.cpu().numpy())
+
+        _text_embeddings[key] = embeddings
+        return embeddings
+
+
+def clip_image_embeddings(imgs_rgb):
+    """L2-normalised CLIP image embeddings, (N, D)"""
+    model_registry.get("clip")
+    image_embeddings = micro_batcher.forward("clip", _clip_image_features, clip_pixel_values(imgs_rgb))
+    return image_embeddings / image_embeddings.norm(dim=-1, keepdim=True)
+
+
+def zero_shot_probabilities(image_embeddings, labels=None):
+    """Softmax over `labels` (default: room types) from precomputed image embeddings"""
+    clip_model = model_registry.get("clip")
+    text_embeddings = get_room_text_embeddings(labels)
+    with torch.no_grad():
+        logits_per_image = clip_model.logit_scale.exp() * image_embeddings @ text_embeddings.T
+        return logits_per_image.softmax(dim=1).cpu().numpy()
+
+
+def classify_room_types(imgs_rgb, labels=None):
+    """
+    Zero-shot room classification as an image-only CLIP forward pass plus a
+    dot product against the cached text embeddings. Returns (N, len(labels)) probabilities.
+    """
+    return zero_shot_probabilities(clip_image_embeddings(imgs_rgb), labels)
 
 
 def estimate_room_size_category(floor_pixel_ratio, room_type):
@@ -169,202 +255,852 @@ def estimate_room_size_category(floor_pixel_ratio, room_type):
         return "large"
 
 
-def detect_defects(img_path):
-    img = cv2.imread(img_path)
-    if img is None:
-        return [], {
-            "width": 0.0, "height": 0.0, "length": 0.0, "area": 0.0,
-            "room_type": "unknown", "room_confidence": 0.0,
-            "area_confidence": 0.0, "estimation_method": "none"
-        }, False, [0, 0]
+def _empty_result():
+    return Detections(), {
+        "width": 0.0, "height": 0.0, "length": 0.0, "area": 0.0,
+        "room_type": "unknown", "room_confidence": 0.0, "floor_ratio": 0.0,
+        "area_confidence": 0.0, "estimation_method": "none"
+    }, False, [0, 0]
 
-    h_orig, w_orig = img.shape[:2]
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    total_pixels = h_orig * w_orig
 
-    # --- Floor Segmentation (ADE20K, SegFormer) ---
-    seg_inputs = segformer_processor(images=img_rgb, return_tensors="pt")
-    with torch.no_grad():
-        seg_outputs = segformer_model(**seg_inputs)
-        seg_logits = seg_outputs.logits.cpu().numpy()[0]
-        seg_mask = np.argmax(seg_logits, axis=0)
-    floor_mask = (seg_mask == 3).astype(np.uint8)
-    floor_pixel_count = int(np.sum(floor_mask))
-    floor_pixel_ratio = floor_pixel_count / (seg_mask.shape[0] * seg_mask.shape[1])
-
-    # --- Room Type Detection (CLIP/ViT zero-shot) ---
-    from PIL import Image
-    pil_img = Image.fromarray(img_rgb)
-    inputs = clip_processor(text=ROOM_TYPE_LABELS, images=pil_img, return_tensors="pt", padding=True)
+def _read_source(source):
+    """
+    Read a file path (or take encoded image bytes, a BGR array or an image_io.DecodedImage)
+    without decoding it, so cache hits never pay for a decode.
+    Returns (what _decode_source takes, bytes identifying the content for the result cache),
+    or (None, None) when the file cannot be read.
+    """
+    if source is None:
+        return None, None
+    if isinstance(source, image_io.DecodedImage):
+        if source.content is not None:
+            return source, source.content
+        full = source.full_resolution()
+        return source, str(full.shape).encode() + np.ascontiguousarray(full).tobytes()
+    if isinstance(source, np.ndarray):
+        return source, str(source.shape).encode() + np.ascontiguousarray(source).tobytes()
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    else:
+        try:
+            with open(source, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None, None
+    return data, data
+
+
+def _decode_source(source):
+    """image_io.DecodedImage at the resolution the models need, or None when it cannot be decoded"""
+    if source is None or isinstance(source, image_io.DecodedImage):
+        return source
+    if isinstance(source, np.ndarray):
+        return image_io.from_array(source)
+    # Decode from the bytes already in memory instead of reading the file twice
+    return image_io.decode_bytes(source)
+
+
+def pipeline_version(cascade_aggressiveness=None):
+    """Identifies everything that shapes a detect_defects result; part of every cache key"""
+    identity = json.dumps([
+        cascade_aggressiveness,
+        # The prescreen resolution decides what the cascade prunes
+        ANALYZER_CASCADE_PRESCREEN_SIZE if cascade_aggressiveness is not None else None,
+        ANALYZER_VERSION,
+        model_registry.SEGFORMER_CHECKPOINT,
+        model_registry.CLIP_CHECKPOINT,
+        model_registry.MIDAS_MODEL_TYPE,
+        os.path.basename(model_registry.OBJECT_MODEL_PATH),
+        os.path.basename(model_registry.CRACK_MODEL_PATH),
+        ROOM_TYPE_LABELS,
+        model_registry.numeric_config(),
+        crack_tiling_config(),
+        # The A4 search resolution changes m_per_px and every area derived from it
+        calibration_config(),
+        # Smaller decodes change what every model sees
+        image_io.MODEL_INPUT_MIN_SIZE,
+    ])
+    return hashlib.sha256(identity.encode()).hexdigest()[:16]
+
+
+def crack_tiling_config():
+    """Tiling settings that shape crack detections, or None when tiling is off"""
+    if not ANALYZER_CRACK_TILING:
+        return None
+    return {
+        "max_side": ANALYZER_CRACK_TILE_MAX_SIDE,
+        "overlap": ANALYZER_CRACK_TILE_OVERLAP,
+        "merge_iou": CRACK_TILE_MERGE_IOU,
+    }
+
+
+def detect_defects(source, cascade: bool = None):
+    """Analyze one photo given as a file path, encoded image bytes or a BGR array"""
+    return detect_defects_batch([source], cascade=cascade)[0]
+
+
+def detect_defects_batch(images, batch_size: int = None, use_cache: bool = True,
+                         cascade: bool = None, cascade_aggressiveness: float = None):
+    """
+    Analyze several photos of a property at once. Each image is a file path, encoded
+    image bytes or a BGR array.
+
+    Each model runs on stacked batches of up to `batch_size` photos instead of
+    one photo at a time. Returns one (detections, spatial_data, is_calibrated,
+    img_size) tuple per input, in input order - the same tuples as detect_defects.
+    detections is a Detections container holding the A4, object and crack boxes.
+    Photos analyzed before with the same pipeline version come from the result cache.
+    spatial_data["stage_timings_ms"] breaks down where the time went.
+
+    In cascade mode (default: ANALYZER_CASCADE) a cheap first pass prunes expensive
+    stages per photo; spatial_data["cascade"] records what was decided and why.
+    """
+    batch_size = batch_size or ANALYZER_BATCH_SIZE
+    if cascade is None:
+        cascade = ANALYZER_CASCADE
+    if cascade and cascade_aggressiveness is None:
+        cascade_aggressiveness = ANALYZER_CASCADE_AGGRESSIVENESS
+    if not cascade:
+        cascade_aggressiveness = None
+    outputs = DEFAULT_OUTPUTS + (("cascade",) if cascade else ())
+
+    results = [None] * len(images)
+    version = pipeline_version(cascade_aggressiveness)
+
+    loaded = []
+    for i, source in enumerate(images):
+        lookup_start = time.perf_counter()
+        raw, content = _read_source(source)
+        if raw is None:
+            results[i] = _empty_result()
+            continue
+
+        cache_key = result_cache.content_key(content, version) if use_cache else None
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            cached[1]["stage_timings_ms"] = {
+                "result_cache": round((time.perf_counter() - lookup_start) * 1000, 1)
+            }
+            results[i] = cached
+            continue
+
+        # Only cache misses are decoded
+        decoded = _decode_source(raw)
+        if decoded is None:
+            results[i] = _empty_result()
+        else:
+            loaded.append((i, decoded, cache_key))
+
+    for start in range(0, len(loaded), batch_size):
+        chunk = loaded[start:start + batch_size]
+        batch = AnalysisBatch([decoded for _, decoded, _ in chunk], cascade_aggressiveness)
+        for (i, _, cache_key), values in zip(chunk, batch.run(outputs)):
+            spatial = {**values["spatial"], "stage_timings_ms": values["stage_timings_ms"]}
+            if cascade:
+                spatial["cascade"] = values["cascade"]
+            result = (
+                values["detections"],
+                spatial,
+                values["is_calibrated"],
+                list(values["decoded"].orig_size),
+            )
+            results[i] = result
+            if cache_key:
+                result_cache.put(cache_key, result)
+
+    return results
+
+
+def analyze_images(images, outputs):
+    """
+    Compute only the requested outputs (any keys produced by STAGES) for each image.
+    Stages that no requested output depends on are never run. Returns one dict per
+    image with the requested values plus "stage_timings_ms"; unreadable images give None.
+    """
+    decoded = [_decode_source(_read_source(source)[0]) for source in images]
+    readable = [i for i, d in enumerate(decoded) if d is not None]
+
+    results = [None] * len(decoded)
+    batch = AnalysisBatch([decoded[i] for i in readable])
+    for i, values in zip(readable, batch.run(outputs)):
+        results[i] = {key: values[key] for key in (*outputs, "stage_timings_ms")}
+    return results
+
+
+# ==================== Model Forward Passes ====================
+#
+# One function per model taking and returning a batch tensor, so concurrent analyses
+# can share a forward pass through micro_batcher (MICROBATCH=1).
+
+def _segformer_logits(pixel_values):
+    model = model_registry.get("segformer")
+    with torch.no_grad(), model_registry.autocast("segformer"):
+        return model(pixel_values=pixel_values).logits.float()
+
+
+def _clip_image_features(pixel_values):
+    model = model_registry.get("clip")
+    with torch.no_grad(), model_registry.autocast("clip"):
+        return model.get_image_features(pixel_values=pixel_values).float()
+
+
+def _midas_depth(input_batch):
+    midas = model_registry.get("midas")
+    device = model_registry.get_device()
+    with torch.no_grad(), model_registry.autocast("midas", device.type):
+        return midas(input_batch.to(device)).float()
+
+
+def _yolo_predictions(name, tensor):
+    network = yolo_network(name)
     with torch.no_grad():
-        outputs = clip_model(**inputs)
-        logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1).cpu().numpy()[0]
-    best_idx = int(np.argmax(probs))
-    room_type_raw = ROOM_TYPE_LABELS[best_idx]
-    room_type = room_type_raw.replace("a ", "").replace("an ", "").strip().title()
-    room_type_key = room_type.lower()
-    room_confidence = float(probs[best_idx])
+        predictions = network(tensor.to(network.device))
+    # Only the first output (boxes and class scores) is used downstream
+    return predictions[0] if isinstance(predictions, (list, tuple)) else predictions
+
+
+def yolo_forward(name, tensor):
+    return micro_batcher.forward(name, functools.partial(_yolo_predictions, name), tensor)
+
+
+# ==================== Analysis Stages ====================
+#
+# The analyzer is a graph of stages. Each stage declares the per-image values it
+# reads and writes; asking an AnalysisBatch for a value runs only the stages on
+# its dependency path, batched over the images that still need it.
+
+class Stage:
+    def __init__(self, name, inputs, outputs, fn, skipped=None, models=(), requires=()):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.fn = fn
+        # Output values for photos the cascade prunes this stage for; None = never pruned
+        self.skipped = skipped
+        # Registry models the stage loads, and values it pulls in for only some images
+        self.models = tuple(models)
+        self.requires = tuple(requires)
+
+
+STAGES = {}
+_PRODUCERS = {}
+
+
+def stage(name, inputs=(), outputs=(), skipped=None, models=(), requires=()):
+    """
+    Register fn(batch, indices) as the stage computing `outputs` for those images.
+    `skipped` makes the stage prunable in cascade mode: it returns the outputs to use instead.
+    `models` names the registry models it uses, `requires` values it asks the batch for itself.
+    """
+    def decorator(fn):
+        STAGES[name] = Stage(name, inputs, outputs, fn, skipped, models, requires)
+        for key in outputs:
+            _PRODUCERS[key] = STAGES[name]
+        return fn
+    return decorator
+
+
+# What detect_defects_batch asks for; is_calibrated and decoded come along with these
+DEFAULT_OUTPUTS = ("detections", "spatial", "is_calibrated", "decoded")
+
+
+def models_for(outputs) -> list:
+    """Registry models the stages producing `outputs` may load, in model_registry.MODEL_NAMES order"""
+    needed = set()
+    visited = set()
+    pending = list(outputs)
+    while pending:
+        producer = _PRODUCERS.get(pending.pop())
+        if producer is None or producer.name in visited:
+            continue
+        visited.add(producer.name)
+        needed.update(producer.models)
+        pending.extend(producer.inputs + producer.requires)
+    return [name for name in model_registry.MODEL_NAMES if name in needed]
+
+
+def default_models() -> list:
+    """Models detect_defects_batch uses with the current settings (MiDaS is not one of them)"""
+    return models_for(DEFAULT_OUTPUTS + (("cascade",) if ANALYZER_CASCADE else ()))
+
+
+class AnalysisBatch:
+    """Per-image values for a chunk of images, computed on demand through the stage graph"""
+
+    def __init__(self, decoded_images, cascade_aggressiveness=None):
+        # "image" is the reduced-resolution working buffer; "decoded" maps back to full size
+        self.values = [{"decoded": d, "image": d.image} for d in decoded_images]
+        # None runs every stage; otherwise the cascade decides per photo which prunable stages run
+        self.cascade_aggressiveness = cascade_aggressiveness
+        self.timings = [{} for _ in decoded_images]
+        self._nested_seconds = 0.0
+
+    def __len__(self):
+        return len(self.values)
+
+    def require(self, key, indices=None):
+        """Make sure `key` is computed for the given images (default: all)"""
+        if indices is None:
+            indices = range(len(self.values))
+        missing = [i for i in indices if key not in self.values[i]]
+        if not missing:
+            return
+
+        producer = _PRODUCERS.get(key)
+        if producer is None:
+            raise KeyError(f"No analyzer stage produces '{key}'")
+
+        if self.cascade_aggressiveness is not None and producer.skipped is not None:
+            self.require("cascade", missing)
+            pruned = [i for i in missing if producer.name in self.values[i]["cascade"]["skipped_stages"]]
+            for i in pruned:
+                self.values[i].update(producer.skipped())
+            missing = [i for i in missing if i not in pruned]
+            if not missing:
+                return
+
+        for dependency in producer.inputs:
+            self.require(dependency, missing)
+
+        start = time.perf_counter()
+        nested_before = self._nested_seconds
+        producer.fn(self, missing)
+        elapsed = time.perf_counter() - start
+        # Stages pulled in by this one mid-run are timed on their own, not here
+        own = elapsed - (self._nested_seconds - nested_before)
+        self._nested_seconds = nested_before + elapsed
+
+        # Batched stages cost the same for every image in the batch
+        per_image_ms = own * 1000 / len(missing)
+        for i in missing:
+            self.timings[i][producer.name] = round(
+                self.timings[i].get(producer.name, 0.0) + per_image_ms, 1
+            )
+
+    def run(self, outputs):
+        with micro_batcher.analysis():
+            for key in outputs:
+                self.require(key)
+        return [
+            {**values, "stage_timings_ms": timings}
+            for values, timings in zip(self.values, self.timings)
+        ]
+
+
+@stage("rgb", inputs=("image",), outputs=("image_rgb",))
+def _stage_rgb(batch, indices):
+    for i in indices:
+        batch.values[i]["image_rgb"] = cv2.cvtColor(batch.values[i]["image"], cv2.COLOR_BGR2RGB)
+
+
+def _normalized_tensor(imgs_rgb, mean, std):
+    """Stack equally sized RGB uint8 arrays into a normalized NCHW float tensor"""
+    stacked = np.stack(imgs_rgb).astype(np.float32) / 255.0
+    stacked = (stacked - np.asarray(mean, np.float32)) / np.asarray(std, np.float32)
+    return torch.from_numpy(stacked.transpose(0, 3, 1, 2).copy())
 
-    # --- MiDaS Depth Estimation ---
-    input_batch = midas_transforms.small_transform(img_rgb).to(device)
+
+def segformer_pixel_values(imgs_rgb):
+    """SegFormer input built with one cv2 resize from the shared RGB buffer"""
+    processor = model_registry.get("segformer_processor")
+    size = (processor.size["width"], processor.size["height"])
+    resized = [cv2.resize(img, size, interpolation=cv2.INTER_LINEAR) for img in imgs_rgb]
+    return _normalized_tensor(resized, processor.image_mean, processor.image_std)
+
+
+def clip_pixel_values(imgs_rgb):
+    """CLIP input (shortest side resize + center crop) built from the shared RGB buffer"""
+    image_processor = model_registry.get("clip_processor").image_processor
+    shortest_edge = image_processor.size["shortest_edge"]
+    crop_h, crop_w = image_processor.crop_size["height"], image_processor.crop_size["width"]
+
+    crops = []
+    for img in imgs_rgb:
+        h, w = img.shape[:2]
+        scale = shortest_edge / min(h, w)
+        new_w, new_h = max(crop_w, round(w * scale)), max(crop_h, round(h * scale))
+        resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
+        top, left = (new_h - crop_h) // 2, (new_w - crop_w) // 2
+        crops.append(resized[top:top + crop_h, left:left + crop_w])
+    return _normalized_tensor(crops, image_processor.image_mean, image_processor.image_std)
+
+
+@stage("floor_segmentation", inputs=("image_rgb",), outputs=("floor_pixel_count", "floor_pixel_ratio"),
+       skipped=lambda: {"floor_pixel_count": 0, "floor_pixel_ratio": 0.0},
+       models=("segformer_processor", "segformer"))
+def _stage_floor_segmentation(batch, indices):
+    """Floor Segmentation (ADE20K, SegFormer)"""
+    pixel_values = segformer_pixel_values([batch.values[i]["image_rgb"] for i in indices])
+    logits = micro_batcher.forward("segformer", _segformer_logits, pixel_values)
+    seg_masks = np.argmax(logits.cpu().numpy(), axis=1)
+
+    for i, seg_mask in zip(indices, seg_masks):
+        floor_pixel_count = int(np.sum(seg_mask == 3))
+        batch.values[i]["floor_pixel_count"] = floor_pixel_count
+        batch.values[i]["floor_pixel_ratio"] = floor_pixel_count / (seg_mask.shape[0] * seg_mask.shape[1])
+
+
+@stage("clip_embedding", inputs=("image_rgb",), outputs=("clip_embedding",), models=("clip_processor", "clip"))
+def _stage_clip_embedding(batch, indices):
+    """CLIP image tower, shared by room type classification and the cascade scene check"""
+    embeddings = clip_image_embeddings([batch.values[i]["image_rgb"] for i in indices])
+    for i, embedding in zip(indices, embeddings):
+        batch.values[i]["clip_embedding"] = embedding
+
+
+@stage("room_type", inputs=("clip_embedding",), outputs=("room_type", "room_confidence"),
+       models=("clip_processor", "clip"))
+def _stage_room_type(batch, indices):
+    """Room Type Detection (CLIP/ViT zero-shot)"""
+    room_probs = zero_shot_probabilities(torch.stack([batch.values[i]["clip_embedding"] for i in indices]))
+
+    for i, probs in zip(indices, room_probs):
+        best_idx = int(np.argmax(probs))
+        batch.values[i]["room_type"] = room_type_name(ROOM_TYPE_LABELS[best_idx])
+        batch.values[i]["room_confidence"] = float(probs[best_idx])
+
+
+@stage("depth", inputs=("image_rgb",), outputs=("depth_range",), models=("midas", "midas_transforms"))
+def _stage_depth(batch, indices):
+    """MiDaS relative depth; only runs when a caller asks for depth_range"""
+    model_registry.get("midas")
+    midas_transforms = model_registry.get("midas_transforms")
+
+    # The transform keeps aspect ratio, so only same-shaped inputs can be stacked
+    shape_groups = {}
+    for i in indices:
+        input_tensor = midas_transforms.small_transform(batch.values[i]["image_rgb"])
+        shape_groups.setdefault(tuple(input_tensor.shape), []).append((i, input_tensor))
+
+    for group in shape_groups.values():
+        predictions = micro_batcher.forward("midas", _midas_depth, torch.cat([t for _, t in group]))
+        # The range is taken at model resolution - upsampling to full size adds nothing
+        for (i, _), prediction in zip(group, predictions):
+            batch.values[i]["depth_range"] = float(prediction.max() - prediction.min())
+
+
+@stage("a4_calibration", inputs=("image",), outputs=("a4_m_per_px", "a4_bbox"))
+def _stage_a4_calibration(batch, indices):
+    """A4 calibration in original-photo pixels, searched on the reduced image first"""
+    for i in indices:
+        decoded = batch.values[i]["decoded"]
+        m_per_px, a4_bbox = _find_a4_reduced(decoded)
+        batch.values[i]["a4_m_per_px"] = m_per_px
+        batch.values[i]["a4_bbox"] = a4_bbox
+
+
+def _find_a4_reduced(decoded):
+    """A4 calibration on the reduced working image, measured at full resolution only when needed"""
+    return locate_a4(
+        decoded.image, decoded.scale_x, decoded.scale_y, decoded.full_resolution,
+        refine_below_px=A4_REFINE_BELOW_PX,
+    )
+
+
+# Ultralytics predict() defaults, kept so detections match the previous per-model calls
+YOLO_IMAGE_SIZE = 640
+YOLO_IOU_THRESHOLD = 0.7
+YOLO_MAX_DETECTIONS = 300
+OBJECT_CONFIDENCE = 0.25
+CRACK_CONFIDENCE = 0.15
+
+_yolo_networks = {}
+_yolo_networks_lock = threading.Lock()
+
+
+def yolo_network(name):
+    """
+    The registry YOLO model wrapped in an Ultralytics AutoBackend, which runs a preprocessed
+    tensor directly (PyTorch or exported weights) without the per-call predictor setup.
+    """
+    model = model_registry.get(name)
+    network = _yolo_networks.get(name)
+    if network is not None and network[0] is model:
+        return network[1]
+
+    from ultralytics.nn.autobackend import AutoBackend
+    with _yolo_networks_lock:
+        network = AutoBackend(model=model.model, device=model_registry.get_device(), fuse=True, verbose=False).eval()
+        _yolo_networks[name] = (model, network)
+        return network
+
+
+class YoloInput:
+    """Letterboxed photos stacked into one normalised tensor shared by both YOLO models"""
+
+    def __init__(self, tensor, image_shape):
+        self.tensor = tensor
+        self.image_shape = image_shape  # (height, width) of the working images before letterboxing
+
+
+def _is_dynamic(network):
+    """Whether a YOLO network accepts inputs other than its export size"""
+    return network.format == "pt" or getattr(network, "dynamic", False)
+
+
+def _letterbox_groups(batch, indices, size, networks):
+    """
+    Letterbox, BGR->RGB and normalise photos for the given networks. Same-shaped photos
+    (the usual case for one property) share a batch tensor; yields (YoloInput, indices).
+    """
+    from ultralytics.data.augment import LetterBox
+
+    # Minimal (stride-aligned) padding instead of a full square, when every network accepts it
+    rect = all(_is_dynamic(net) for net in networks)
+    stride = max(int(net.stride) for net in networks)
+
+    shape_groups = {}
+    for i in indices:
+        shape_groups.setdefault(batch.values[i]["image"].shape, []).append(i)
+
+    for shape, group in shape_groups.items():
+        letterbox = LetterBox(size, auto=rect, stride=stride)
+        boxed = np.stack([letterbox(image=batch.values[i]["image"]) for i in group])
+        tensor = torch.from_numpy(boxed).permute(0, 3, 1, 2).flip(1).contiguous().float().div_(255)
+        yield YoloInput(tensor, shape[:2]), group
+
+
+@stage("yolo_input", inputs=("image",), outputs=("yolo_input", "yolo_row"), models=("yolo_objects", "yolo_cracks"))
+def _stage_yolo_input(batch, indices):
+    """Letterbox, BGR->RGB and normalise once per photo for both YOLO models"""
+    networks = [yolo_network("yolo_objects"), yolo_network("yolo_cracks")]
+    for yolo_input, group in _letterbox_groups(batch, indices, YOLO_IMAGE_SIZE, networks):
+        for row, i in enumerate(group):
+            batch.values[i]["yolo_input"] = yolo_input
+            batch.values[i]["yolo_row"] = row
+
+
+def _run_yolo(batch, indices, name, conf):
+    """
+    Run a YOLO network on the shared input tensors. Yields (index, boxes, confidences, classes)
+    as NumPy arrays, with xywh boxes already scaled to original-photo pixels.
+    """
+    from ultralytics.utils.nms import non_max_suppression
+    from ultralytics.utils.ops import scale_boxes
+
+    network = yolo_network(name)
+    groups = {}
+    for i in indices:
+        groups.setdefault(id(batch.values[i]["yolo_input"]), []).append(i)
+
+    for group in groups.values():
+        yolo_input = batch.values[group[0]]["yolo_input"]
+        rows = [batch.values[i]["yolo_row"] for i in group]
+        tensor = yolo_input.tensor
+        if len(rows) != len(tensor):
+            tensor = tensor[rows]
+
+        predictions = yolo_forward(name, tensor)
+        with torch.no_grad():
+            results = non_max_suppression(
+                predictions, conf, YOLO_IOU_THRESHOLD, max_det=YOLO_MAX_DETECTIONS,
+                end2end=getattr(network, "end2end", False),
+            )
+
+        for i, det in zip(group, results):
+            decoded = batch.values[i]["decoded"]
+            xyxy = scale_boxes(tensor.shape[2:], det[:, :4].clone(), yolo_input.image_shape)
+            xyxy *= xyxy.new_tensor([decoded.scale_x, decoded.scale_y, decoded.scale_x, decoded.scale_y])
+            xywh = torch.cat((xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]), dim=1)
+            yield i, xywh.cpu().numpy(), det[:, 4].cpu().numpy(), det[:, 5].int().cpu().numpy()
+
+
+@stage("object_detection", inputs=("yolo_input",), outputs=("object_detections",),
+       skipped=lambda: {"object_detections": Detections()}, models=("yolo_objects",))
+def _stage_object_detection(batch, indices):
+    """Object Detections (YOLO)"""
+    names = yolo_network("yolo_objects").names
+    labels = [str(names[cls]) for cls in sorted(names)]
+    for i, boxes, confidences, classes in _run_yolo(batch, indices, "yolo_objects", OBJECT_CONFIDENCE):
+        batch.values[i]["object_detections"] = Detections(boxes, confidences, classes, labels)
+
+
+@stage("crack_detection", inputs=("yolo_input",), outputs=("crack_detections",),
+       skipped=lambda: {"crack_detections": Detections()}, models=("yolo_cracks",))
+def _stage_crack_detection(batch, indices):
+    """Crack Detections (Custom Model), plus overlapping tiles of large photos in tiled mode"""
+    for i, boxes, confidences, _ in _run_yolo(batch, indices, "yolo_cracks", CRACK_CONFIDENCE):
+        decoded = batch.values[i]["decoded"]
+        if ANALYZER_CRACK_TILING and max(decoded.orig_size) > YOLO_IMAGE_SIZE:
+            boxes, confidences = _merge_crack_tiles(boxes, confidences, decoded)
+        batch.values[i]["crack_detections"] = Detections(
+            boxes, confidences, np.zeros(len(boxes)), ["Structural Crack"], flags=FLAG_CRACK
+        )
+
+
+# ==================== Tiled Crack Detection ====================
+
+# IoU above which boxes from the whole-photo pass and overlapping tiles count as the same crack
+CRACK_TILE_MERGE_IOU = 0.5
+
+# Letterbox padding value, for tiles that hang over the photo's edge
+_TILE_PAD_VALUE = 114
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of tiles covering `length` pixels, the last one flush with the end"""
+    if length <= tile:
+        return [0]
+    step = max(int(tile * (1 - overlap)), 1)
+    origins = list(range(0, length - tile, step))
+    origins.append(length - tile)
+    return origins
+
+
+def _detect_tiles(network, source, origins):
+    """Crack boxes (xyxy, in `source` pixels) and scores for one batch of tiles"""
+    from ultralytics.utils.nms import non_max_suppression
+
+    size = YOLO_IMAGE_SIZE
+    tiles = np.full((len(origins), size, size, 3), _TILE_PAD_VALUE, np.uint8)
+    for k, (x, y) in enumerate(origins):
+        crop = source[y:y + size, x:x + size]
+        tiles[k, :crop.shape[0], :crop.shape[1]] = crop
+    tensor = torch.from_numpy(tiles).permute(0, 3, 1, 2).flip(1).contiguous().float().div_(255)
+
+    predictions = yolo_forward("yolo_cracks", tensor)
     with torch.no_grad():
-        prediction = midas(input_batch)
-        prediction = torch.nn.functional.interpolate(
-            prediction.unsqueeze(1), size=(h_orig, w_orig), mode="bicubic"
-        ).squeeze()
-    depth_map = prediction.cpu().numpy()
-    depth_range = float(np.max(depth_map) - np.min(depth_map))
-
-    # --- 1. Calibration (A4 first, then reference objects) ---
-    m_per_px, a4_bbox = find_a4_calibration(img)
-    is_a4_calibrated = m_per_px is not None
-
-    all_results = []
-    if is_a4_calibrated:
-        all_results.append({
-            "label": "A4 Reference",
-            "confidence": 1.0,
-            "bbox": a4_bbox,
-            "isCrack": False,
-            "isCalibration": True
-        })
-
-    # Add room type result
-    all_results.append({
-        "label": "Room Type",
-        "room_type": room_type,
-        "confidence": room_confidence,
-        "isRoomType": True
-    })
-
-    # Add floor segmentation result
-    all_results.append({
-        "label": "Floor Segmentation",
-        "floor_pixel_count": floor_pixel_count,
-        "floor_ratio": round(floor_pixel_ratio, 3),
-        "isFloorMask": True
-    })
-
-    # --- 2. Object Detections (YOLO) ---
-    obj_res = obj_model(img)
-    object_detections = []
-    for r in obj_res:
-        for box in r.boxes:
-            b = box.xyxy[0].tolist()
-            det = {
-                "label": str(obj_model.names[int(box.cls)]),
-                "confidence": float(box.conf[0]),
-                "bbox": [b[0], b[1], b[2]-b[0], b[3]-b[1]],
-                "isCrack": False,
-                "isCalibration": False
-            }
-            object_detections.append(det)
-            all_results.append(det)
-
-    # --- 3. Crack Detections (Custom Model) ---
-    crack_res = crack_model.predict(source=img, conf=0.15)
-    total_crack_pixel_area = 0
-    max_crack_dim_px = 0
-
-    for r in crack_res:
-        for box in r.boxes:
-            b = box.xyxy[0].tolist()
-            bw, bh = b[2]-b[0], b[3]-b[1]
-            total_crack_pixel_area += (bw * bh)
-            max_crack_dim_px = max(max_crack_dim_px, bw, bh)
-
-            all_results.append({
-                "label": "Structural Crack",
-                "confidence": float(box.conf[0]),
-                "bbox": [b[0], b[1], bw, bh],
-                "isCrack": True,
-                "isCalibration": False
-            })
-
-    # --- 4. Scale Estimation (Reference Objects if no A4) ---
-    reference_object_used = None
-    ref_confidence = 0.0
-    
-    if not is_a4_calibrated:
-        ref_m_per_px, reference_object_used, ref_confidence = estimate_scale_from_reference_objects(
-            object_detections, w_orig, h_orig
+        results = non_max_suppression(
+            predictions, CRACK_CONFIDENCE, YOLO_IOU_THRESHOLD, max_det=YOLO_MAX_DETECTIONS,
+            end2end=getattr(network, "end2end", False),
         )
-        if ref_m_per_px is not None:
-            m_per_px = ref_m_per_px
 
-    # --- 5. Area Calculation ---
+    offsets = torch.tensor([[x, y, x, y] for x, y in origins], dtype=torch.float32)
+    boxes = [det[:, :4].cpu() + offset for det, offset in zip(results, offsets)]
+    scores = [det[:, 4].cpu() for det in results]
+    return torch.cat(boxes), torch.cat(scores)
+
+
+def detect_crack_tiles(decoded):
+    """
+    Run the crack model on overlapping tiles of the photo at up to ANALYZER_CRACK_TILE_MAX_SIDE.
+    Only that one decode plus ANALYZER_CRACK_TILE_WORKERS batches of tiles are held in memory,
+    however large the photo. Returns xyxy boxes in original-photo pixels and their scores.
+    """
+    network = yolo_network("yolo_cracks")
+    source = decoded.at_most(ANALYZER_CRACK_TILE_MAX_SIDE)
+    h, w = source.shape[:2]
+    origins = [
+        (x, y)
+        for y in tile_origins(h, YOLO_IMAGE_SIZE, ANALYZER_CRACK_TILE_OVERLAP)
+        for x in tile_origins(w, YOLO_IMAGE_SIZE, ANALYZER_CRACK_TILE_OVERLAP)
+    ]
+    step = max(ANALYZER_CRACK_TILE_BATCH, 1)
+    chunks = [origins[k:k + step] for k in range(0, len(origins), step)]
+
+    # Torch releases the GIL inside the forward pass, so tile batches run on several cores
+    with ThreadPoolExecutor(max_workers=max(ANALYZER_CRACK_TILE_WORKERS, 1),
+                            thread_name_prefix="crack-tiles") as pool:
+        parts = list(pool.map(lambda chunk: _detect_tiles(network, source, chunk), chunks))
+
+    boxes = torch.cat([part[0] for part in parts])
+    scores = torch.cat([part[1] for part in parts])
+    # Tiles hanging over the edge were padded; keep boxes inside the photo
+    boxes[:, 0::2] = boxes[:, 0::2].clamp(0, w)
+    boxes[:, 1::2] = boxes[:, 1::2].clamp(0, h)
+    orig_h, orig_w = decoded.orig_size
+    boxes *= boxes.new_tensor([orig_w / w, orig_h / h, orig_w / w, orig_h / h])
+    return boxes, scores
+
+
+def _merge_crack_tiles(boxes, confidences, decoded):
+    """Whole-photo crack boxes (xywh) merged with the tiled ones by cross-tile NMS"""
+    from torchvision.ops import nms
+
+    tile_boxes, tile_scores = detect_crack_tiles(decoded)
+    xyxy = torch.from_numpy(boxes).float().clone()
+    xyxy[:, 2:] += xyxy[:, :2]
+    all_boxes = torch.cat([xyxy, tile_boxes])
+    all_scores = torch.cat([torch.from_numpy(confidences).float(), tile_scores])
+
+    keep = nms(all_boxes, all_scores, CRACK_TILE_MERGE_IOU)[:YOLO_MAX_DETECTIONS]
+    merged = all_boxes[keep]
+    merged[:, 2:] -= merged[:, :2]
+    return merged.numpy(), all_scores[keep].numpy()
+
+
+# ==================== Cascade ====================
+
+@stage("crack_prescreen", inputs=("image",), outputs=("crack_prescreen_score",), models=("yolo_cracks",))
+def _stage_crack_prescreen(batch, indices):
+    """Best crack score of the crack YOLO on a low-resolution letterbox (no NMS needed)"""
+    network = yolo_network("yolo_cracks")
+    # A fixed-size export only runs at the size it was exported with
+    size = ANALYZER_CASCADE_PRESCREEN_SIZE if _is_dynamic(network) else YOLO_IMAGE_SIZE
+
+    for yolo_input, group in _letterbox_groups(batch, indices, size, [network]):
+        predictions = yolo_forward("yolo_cracks", yolo_input.tensor)
+        if getattr(network, "end2end", False):
+            scores = predictions[..., 4].amax(dim=1)  # (N, max_det, 6)
+        else:
+            scores = predictions[:, 4:].amax(dim=(1, 2))  # (N, 4 + classes, anchors)
+        for i, score in zip(group, scores.tolist()):
+            batch.values[i]["crack_prescreen_score"] = score
+
+
+@stage("cascade", inputs=("clip_embedding", "crack_prescreen_score"), outputs=("cascade",),
+       models=("clip_processor", "clip"))
+def _stage_cascade(batch, indices):
+    """
+    Decide which expensive stages are worth running per photo. Floor segmentation and object
+    detection are pruned for photos CLIP sees as exteriors, full crack detection for photos
+    whose low-resolution pre-screen finds nothing crack-like.
+    """
+    aggressiveness = min(max(batch.cascade_aggressiveness, 0.0), 1.0)
+    scene_probs = zero_shot_probabilities(
+        torch.stack([batch.values[i]["clip_embedding"] for i in indices]), SCENE_LABELS
+    )
+
+    for i, probs in zip(indices, scene_probs):
+        interior_probability = float(probs[0])
+        crack_score = batch.values[i]["crack_prescreen_score"]
+
+        skipped = []
+        if interior_probability < aggressiveness * 0.5:
+            skipped += ["floor_segmentation", "object_detection"]
+        if crack_score < aggressiveness * CRACK_CONFIDENCE:
+            skipped.append("crack_detection")
+
+        batch.values[i]["cascade"] = {
+            "aggressiveness": aggressiveness,
+            "scene": "interior" if int(np.argmax(probs)) == 0 else "exterior",
+            "interior_probability": round(interior_probability, 3),
+            "crack_prescreen_score": round(crack_score, 3),
+            "skipped_stages": skipped,
+        }
+
+
+@stage("scale", inputs=("a4_m_per_px",),
+       outputs=("m_per_px", "is_calibrated", "reference_object", "reference_confidence"),
+       requires=("object_detections",))
+def _stage_scale(batch, indices):
+    """Calibration: A4 first, then reference objects"""
+    # Object detection is only needed for images where the A4 sheet was not found
+    uncalibrated = [i for i in indices if batch.values[i]["a4_m_per_px"] is None]
+    batch.require("object_detections", uncalibrated)
+
+    for i in indices:
+        values = batch.values[i]
+        m_per_px = values["a4_m_per_px"]
+        reference_object_used = None
+        ref_confidence = 0.0
+
+        if m_per_px is None:
+            h_orig, w_orig = values["decoded"].orig_size
+            ref_m_per_px, reference_object_used, ref_confidence = estimate_scale_from_reference_objects(
+                values["object_detections"], w_orig, h_orig
+            )
+            if ref_m_per_px is not None:
+                m_per_px = ref_m_per_px
+
+        values["m_per_px"] = m_per_px
+        values["is_calibrated"] = m_per_px is not None
+        values["reference_object"] = reference_object_used
+        values["reference_confidence"] = ref_confidence
+
+
+@stage("detections",
+       inputs=("a4_bbox", "object_detections", "crack_detections"),
+       outputs=("detections",))
+def _stage_detections(batch, indices):
+    """All boxes of a photo (A4 sheet, objects, cracks) in one Detections container"""
+    for i in indices:
+        values = batch.values[i]
+        parts = []
+        if values["a4_m_per_px"] is not None:
+            parts.append(Detections([values["a4_bbox"]], [1.0], [0], ["A4 Reference"], flags=FLAG_CALIBRATION))
+        parts.append(values["object_detections"])
+        parts.append(values["crack_detections"])
+        values["detections"] = Detections.concatenate(parts)
+
+
+@stage("spatial", inputs=("floor_pixel_count", "room_type", "m_per_px"), outputs=("spatial",))
+def _stage_spatial(batch, indices):
+    for i in indices:
+        batch.values[i]["spatial"] = _estimate_spatial(batch.values[i])
+
+
+def _estimate_spatial(values):
+    """Area Calculation"""
+    h_orig, w_orig = values["decoded"].orig_size
+    floor_pixel_count = values["floor_pixel_count"]
+    floor_pixel_ratio = values["floor_pixel_ratio"]
+    room_type = values["room_type"]
+    room_type_key = room_type.lower()
+    m_per_px = values["m_per_px"]
+    is_calibrated = values["is_calibrated"]
+    is_a4_calibrated = values["a4_m_per_px"] is not None
+    ref_confidence = values["reference_confidence"]
+
     spatial_data = {
         "width": 0.0,
         "height": 0.0,
         "length": 0.0,
         "area": 0.0,
         "room_type": room_type,
-        "room_confidence": round(room_confidence * 100, 1),
+        "room_confidence": round(values["room_confidence"] * 100, 1),
+        "floor_ratio": round(values["floor_pixel_ratio"], 3),
         "area_confidence": 0.0,
         "estimation_method": "none",
-        "reference_object": reference_object_used
+        "reference_object": values["reference_object"]
     }
 
-    is_calibrated = m_per_px is not None
-
     if is_calibrated and floor_pixel_count > 0:
         # Best case: We have scale AND floor segmentation
         # Scale up the segmentation mask to original image size
-        seg_h, seg_w = seg_mask.shape
-        scale_factor = (h_orig / seg_h) * (w_orig / seg_w)
-        scaled_floor_pixels = floor_pixel_count * scale_factor
-        
+        scaled_floor_pixels = floor_pixel_ratio * h_orig * w_orig
+    
         area_sq_m = scaled_floor_pixels * (m_per_px ** 2)
-        
+    
         # Sanity check: room areas typically 4-100 sq.m
         if area_sq_m < 2:
             area_sq_m *= 10  # Likely underestimated
         elif area_sq_m > 200:
             area_sq_m /= 10  # Likely overestimated
-        
+    
         # Estimate dimensions as sqrt for roughly square rooms
         side = np.sqrt(area_sq_m)
-        
+    
         spatial_data["area"] = round(float(area_sq_m), 2)
         spatial_data["width"] = round(float(side * 1.1), 2)  # Slightly wider
         spatial_data["length"] = round(float(side * 0.9), 2)  # Slightly shorter
         spatial_data["height"] = 2.7  # Standard ceiling height
-        
+    
         if is_a4_calibrated:
             spatial_data["estimation_method"] = "a4_calibration"
             spatial_data["area_confidence"] = 85.0
         else:
             spatial_data["estimation_method"] = "reference_object"
             spatial_data["area_confidence"] = round(ref_confidence * 80, 1)
-            
+        
     elif floor_pixel_count > 0:
         # Fallback: Use room type averages with floor ratio hint
         size_category = estimate_room_size_category(floor_pixel_ratio, room_type_key)
-        
+    
         if room_type_key in AVERAGE_ROOM_SIZES:
             avg_area = AVERAGE_ROOM_SIZES[room_type_key][size_category]
         else:
             avg_area = AVERAGE_ROOM_SIZES["bedroom"][size_category]
-        
+    
         side = np.sqrt(avg_area)
-        
+    
         spatial_data["area"] = round(float(avg_area), 2)
         spatial_data["width"] = round(float(side * 1.1), 2)
         spatial_data["length"] = round(float(side * 0.9), 2)
         spatial_data["height"] = 2.7
         spatial_data["estimation_method"] = f"room_average_{size_category}"
         spatial_data["area_confidence"] = 40.0  # Low confidence for averages
-        
+    
     else:
         # Worst case: No floor detected, use very rough estimate
         if room_type_key in AVERAGE_ROOM_SIZES:
             avg_area = AVERAGE_ROOM_SIZES[room_type_key]["medium"]
         else:
             avg_area = 14.0  # Default medium room
-        
+    
         side = np.sqrt(avg_area)
-        
+    
         spatial_data["area"] = round(float(avg_area), 2)
         spatial_data["width"] = round(float(side * 1.1), 2)
         spatial_data["length"] = round(float(side * 0.9), 2)
@@ -372,4 +1108,4 @@ def detect_defects(img_path):
         spatial_data["estimation_method"] = "room_type_default"
         spatial_data["area_confidence"] = 25.0
 
-    return all_results, spatial_data, is_calibrated, [h_orig, w_orig]
+    return spatial_data
@@ -0,0 +1,116 @@
+"""
+VisionEstate - Backend Benchmark
+Compares cold start, first-request latency and steady-state latency of the inference backends
+(eager torch, TorchScript archives, ONNX Runtime) for the analyzer models.
+
+Every (model, backend) pair runs in a fresh Python process, so cold start covers the imports
+and model loading a new worker pays. Run it twice: the first pass also warms the OS page cache.
+
+    python backend_benchmark.py photos/
+    python backend_benchmark.py a.jpg --models midas --backends torch torchscript --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Taken before the heavy imports, so a child process measures them too
+_PROCESS_START = time.perf_counter()
+
+BENCHMARK_MODELS = ["segformer", "clip", "midas"]
+BACKENDS = ["torch", "torchscript", "onnx"]
+
+
+def measure_process(name, image_paths, repeat) -> dict:
+    """Cold start, first request and steady state of one model in this (fresh) process"""
+    import numpy as np
+    import precision_report
+    import model_registry
+
+    imports_done = time.perf_counter()
+    model_registry.get(name)
+    loaded = time.perf_counter()
+
+    imgs_rgb = precision_report.load_reference_images(image_paths)
+    run = precision_report.RUNNERS[name]
+    start = time.perf_counter()
+    run(imgs_rgb)  # also loads the processors and caches the CLIP text embeddings
+    first_request = time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(imgs_rgb)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        # The registry falls back to torch when nothing was exported for the backend
+        "backend": model_registry.model_stats()["models"][name]["backend"],
+        "import_s": round(imports_done - _PROCESS_START, 2),
+        "load_s": round(loaded - imports_done, 2),
+        "cold_start_s": round(loaded - _PROCESS_START, 2),
+        "first_request_ms": round(first_request * 1000, 1),
+        "steady_ms_per_image": round(float(np.median(timings)) / len(imgs_rgb) * 1000, 1),
+    }
+
+
+def run_child(name, backend, image_paths, repeat) -> dict:
+    env = dict(os.environ, **{f"ANALYZER_BACKEND_{name.upper()}": backend})
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--repeat", str(repeat), *image_paths]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr[-2000:])
+        return {"backend": backend, "error": f"exit code {completed.returncode}"}
+    # The measurement is the last line; model loading may print before it
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def backend_benchmark(image_paths, models=None, backends=None, repeat=5) -> dict:
+    report = {"images": image_paths, "models": {}}
+    for name in models or BENCHMARK_MODELS:
+        rows = {}
+        for backend in backends or BACKENDS:
+            print(f"Measuring {name} ({backend})...")
+            row = run_child(name, backend, image_paths, repeat)
+            if row.get("backend") != backend and "error" not in row:
+                print(f"  no {backend} export for {name}, skipped")
+                continue
+            rows[backend] = row
+        eager = rows.get("torch", {}).get("steady_ms_per_image")
+        for row in rows.values():
+            if eager and row.get("steady_ms_per_image"):
+                row["steady_speedup"] = round(eager / row["steady_ms_per_image"], 2)
+        report["models"][name] = rows
+    return report
+
+
+def print_report(report):
+    for name, rows in report["models"].items():
+        print(f"\n{name}")
+        for backend, row in rows.items():
+            metrics = ", ".join(f"{key}={value}" for key, value in row.items() if key != "backend")
+            print(f"  {backend:11} {metrics}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start and latency of each inference backend")
+    parser.add_argument("images", nargs="+", help="Reference image files or directories")
+    parser.add_argument("--models", nargs="+", choices=BENCHMARK_MODELS, help="Models to measure (default: all)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, help="Backends to compare (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed steady-state runs")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--child", choices=BENCHMARK_MODELS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_process(args.child, args.images, args.repeat)))
+        sys.exit(0)
+
+    result = backend_benchmark(args.images, args.models, args.backends, args.repeat)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,200 @@
+"""
+VisionEstate - A4 Calibration
+Finds the A4 reference sheet to establish a meters-per-pixel scale. The sheet is searched for
+on a downscaled pyramid level and only measured at full resolution inside its ROI.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+A4_LONG_EDGE_M = 0.297
+A4_ASPECT = 1.414
+
+# Smallest sheet area considered, in full-resolution pixels
+A4_MIN_AREA_PX = 3000
+
+# Long side of the pyramid level the sheet is searched on
+A4_SEARCH_MAX_SIDE = int(os.getenv("A4_SEARCH_MAX_SIDE", "1024"))
+
+# Below this many pixels along its long edge on the search level, a sheet found there is
+# re-measured at full resolution when the full image has to be decoded for it
+A4_REFINE_BELOW_PX = 200
+
+# Candidate regions measured at full resolution before giving up
+A4_MAX_CANDIDATES = 6
+
+
+def calibration_config() -> dict:
+    """Pyramid search settings that shape m_per_px"""
+    return {
+        "search_max_side": A4_SEARCH_MAX_SIDE,
+        "refine_below_px": A4_REFINE_BELOW_PX,
+        "min_area_px": A4_MIN_AREA_PX,
+        "max_candidates": A4_MAX_CANDIDATES,
+    }
+
+
+def _a4_shaped_contours(img, min_area):
+    """Contours big enough to be the sheet whose min-area rect has an A4-like aspect ratio"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.bilateralFilter(gray, 9, 75, 75)
+    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    kernel = np.ones((5, 5), np.uint8)
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area < min_area:
+            continue
+
+        rect = cv2.minAreaRect(cnt)
+        (cx, cy), (rw, rh), angle = rect
+        if min(rw, rh) == 0:
+            continue
+
+        aspect = max(rw, rh) / min(rw, rh)
+        if 1.2 < aspect < 1.7:
+            yield cnt, rect, aspect
+
+
+def measure_a4(img, min_area=A4_MIN_AREA_PX):
+    """
+    Detects ONLY the A4 sheet by verifying it is a 4-sided polygon
+    with a specific aspect ratio (~1.41), at the resolution of `img`.
+    min_area is in pixels of `img`.
+    """
+    candidates = []
+    for cnt, rect, aspect in _a4_shaped_contours(img, min_area):
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+
+        if len(approx) == 4:
+            score = 1.0 - abs(aspect - A4_ASPECT)
+            candidates.append({'approx': approx, 'score': score, 'rect': rect})
+
+    if not candidates:
+        return None, None
+
+    best = max(candidates, key=lambda x: x['score'])
+    rect = best['rect']
+    pixel_length = max(rect[1])
+    m_per_px = A4_LONG_EDGE_M / pixel_length
+
+    x, y, w, h = cv2.boundingRect(best['approx'])
+    return float(m_per_px), [float(x), float(y), float(w), float(h)]
+
+
+def _measure_in_roi(full, region, scale_x, scale_y):
+    """Re-measure a sheet found at (x, y, w, h) on the search level inside a padded full-resolution ROI"""
+    x, y, w, h = region
+    pad_x, pad_y = w * 0.5, h * 0.5
+    x0 = int(max((x - pad_x) * scale_x, 0))
+    y0 = int(max((y - pad_y) * scale_y, 0))
+    x1 = int(min((x + w + pad_x) * scale_x, full.shape[1]))
+    y1 = int(min((y + h + pad_y) * scale_y, full.shape[0]))
+    m_per_px, roi_bbox = measure_a4(full[y0:y1, x0:x1])
+    if m_per_px is None:
+        return None, None
+    return m_per_px, [roi_bbox[0] + x0, roi_bbox[1] + y0, roi_bbox[2], roi_bbox[3]]
+
+
+def _bright_a4_regions(level, min_area):
+    """
+    Bounding rects of solid regions brighter than their surroundings with an A4-like aspect ratio.
+    Unlike the edge-based search this does not depend on the sheet's outline surviving downscaling.
+    """
+    gray = cv2.cvtColor(level, cv2.COLOR_BGR2GRAY)
+    block_size = max(level.shape[:2]) // 8 | 1
+    bright = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, block_size, -15)
+    bright = cv2.morphologyEx(bright, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(bright, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area < min_area:
+            continue
+        (cx, cy), (rw, rh), angle = cv2.minAreaRect(cnt)
+        if min(rw, rh) == 0:
+            continue
+        aspect = max(rw, rh) / min(rw, rh)
+        if 1.2 < aspect < 1.7 and area / (rw * rh) > 0.8:
+            regions.append((abs(aspect - A4_ASPECT), cv2.boundingRect(cnt)))
+    return [region for _, region in sorted(regions)]
+
+
+def _contains_center(region, other):
+    x, y, w, h = region
+    cx, cy = other[0] + other[2] / 2, other[1] + other[3] / 2
+    return x <= cx <= x + w and y <= cy <= y + h
+
+
+def locate_a4(level, scale_x, scale_y, full_resolution, min_area=A4_MIN_AREA_PX, refine_below_px=None):
+    """
+    Find the sheet on a downscaled image `level` and return (m_per_px, bbox) in full-resolution
+    pixels. `full_resolution` is called (at most once) to get the full image for ROI measurement.
+
+    A sheet whose long edge on `level` is at least `refine_below_px` is measured there directly;
+    with refine_below_px=None every sheet is re-measured at full resolution.
+    """
+    level_min_area = min_area / (scale_x * scale_y)
+    m_per_px, bbox = measure_a4(level, min_area=level_min_area)
+    if scale_x <= 1.0 and scale_y <= 1.0:
+        return m_per_px, bbox
+
+    if m_per_px is not None and refine_below_px is not None and A4_LONG_EDGE_M / m_per_px >= refine_below_px:
+        # Large enough to measure precisely here; convert to full-resolution pixels
+        scale = (scale_x + scale_y) / 2
+        return m_per_px / scale, [bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y]
+
+    # Downscaling can merge the sheet's outline with background texture or round off its
+    # corners, so bright A4-shaped regions and small A4-shaped outlines are candidates too
+    candidates = [bbox] if m_per_px is not None else []
+    candidates += _bright_a4_regions(level, level_min_area)
+    candidates += [
+        region for _, region in sorted(
+            (abs(aspect - A4_ASPECT), cv2.boundingRect(cnt))
+            for cnt, rect, aspect in _a4_shaped_contours(level, level_min_area)
+            if max(rect[1]) < A4_REFINE_BELOW_PX
+        )
+    ]
+
+    regions = []
+    for candidate in candidates:
+        if not any(_contains_center(region, candidate) for region in regions):
+            regions.append(candidate)
+    if not regions:
+        return None, None
+
+    full = full_resolution()
+    for region in regions[:A4_MAX_CANDIDATES]:
+        m_per_px, full_bbox = _measure_in_roi(full, region, scale_x, scale_y)
+        if m_per_px is not None:
+            return m_per_px, full_bbox
+    return None, None
+
+
+def pyramid_level(img, max_side=A4_SEARCH_MAX_SIDE):
+    """Downscale by the smallest power of two that brings the long side to max_side or less"""
+    h, w = img.shape[:2]
+    factor = 1
+    while max(h, w) / factor > max_side:
+        factor *= 2
+    if factor == 1:
+        return img, 1.0, 1.0
+
+    level = cv2.resize(img, (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+    return level, w / level.shape[1], h / level.shape[0]
+
+
+def find_a4_calibration(img, min_area=A4_MIN_AREA_PX):
+    """
+    Detects A4 paper to establish a Meters-per-Pixel scale.
+    Returns (m_per_px, [x, y, w, h]) in pixels of `img`, or (None, None).
+    """
+    level, scale_x, scale_y = pyramid_level(img)
+    return locate_a4(level, scale_x, scale_y, lambda: img, min_area=min_area)
@@ -0,0 +1,178 @@
+"""
+VisionEstate - Detection Container
+Struct-of-arrays storage for detected boxes: one NumPy array per field instead of a dict per box.
+"""
+
+import numpy as np
+
+# Bit flags per detection
+FLAG_CRACK = 1
+FLAG_CALIBRATION = 2
+
+# Version tag of the compact serialized form
+COMPACT_FORMAT = 1
+
+
+class Detections:
+    """
+    Boxes from one or more photos.
+
+    boxes are [x, y, width, height] in original-photo pixels; class_ids index into `labels`,
+    which is shared by every row; photo is the index of the source photo within a property.
+    """
+
+    def __init__(self, boxes=None, scores=None, class_ids=None, labels=None, photo=None, flags=None):
+        self.boxes = np.asarray(boxes if boxes is not None else np.empty((0, 4)), np.float32).reshape(-1, 4)
+        n = len(self.boxes)
+        self.scores = np.asarray(scores if scores is not None else np.ones(n), np.float32)
+        self.class_ids = np.asarray(class_ids if class_ids is not None else np.zeros(n), np.int32)
+        self.labels = list(labels or [])
+        self.photo = _column(photo, n, np.int32)
+        self.flags = _column(flags, n, np.uint8)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, selection):
+        """Rows selected by a boolean mask or index array, sharing the label list"""
+        return Detections(
+            self.boxes[selection], self.scores[selection], self.class_ids[selection],
+            self.labels, self.photo[selection], self.flags[selection],
+        )
+
+    def __repr__(self):
+        return f"Detections({len(self)} boxes, {len(self.labels)} labels)"
+
+    @property
+    def is_crack(self):
+        return (self.flags & FLAG_CRACK) != 0
+
+    @property
+    def is_calibration(self):
+        return (self.flags & FLAG_CALIBRATION) != 0
+
+    @property
+    def label_names(self):
+        """Label of every row"""
+        return np.asarray(self.labels, dtype=object)[self.class_ids] if len(self) else np.empty(0, dtype=object)
+
+    @property
+    def crack_count(self) -> int:
+        return int(np.count_nonzero(self.is_crack))
+
+    def with_photo(self, index: int):
+        """Same rows attributed to the given source photo"""
+        return Detections(self.boxes, self.scores, self.class_ids, self.labels, index, self.flags)
+
+    def select_labels(self, names):
+        """Boolean mask of rows whose label is one of `names`"""
+        wanted = np.isin(np.asarray(self.labels, dtype=object), list(names))
+        return wanted[self.class_ids] if len(self) else np.zeros(0, bool)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Merge several containers, remapping class ids onto one combined label list"""
+        parts = [part for part in parts if part is not None]
+        labels = []
+        index = {}
+        class_ids = []
+        for part in parts:
+            remap = np.empty(len(part.labels), np.int32)
+            for i, label in enumerate(part.labels):
+                if label not in index:
+                    index[label] = len(labels)
+                    labels.append(label)
+                remap[i] = index[label]
+            class_ids.append(remap[part.class_ids] if len(part) else part.class_ids)
+
+        if not parts:
+            return cls()
+        return cls(
+            np.concatenate([part.boxes for part in parts]),
+            np.concatenate([part.scores for part in parts]),
+            np.concatenate(class_ids),
+            labels,
+            np.concatenate([part.photo for part in parts]),
+            np.concatenate([part.flags for part in parts]),
+        )
+
+    # ==================== Serialization ====================
+
+    def to_compact(self) -> dict:
+        """JSON-ready columns; boxes rounded to 0.1 px and scores to 4 decimals"""
+        return {
+            "format": COMPACT_FORMAT,
+            "labels": self.labels,
+            "boxes": np.round(self.boxes.astype(np.float64), 1).ravel().tolist(),
+            "scores": np.round(self.scores.astype(np.float64), 4).tolist(),
+            "class_ids": self.class_ids.tolist(),
+            "photo": self.photo.tolist(),
+            "flags": self.flags.tolist(),
+        }
+
+    @classmethod
+    def from_compact(cls, data: dict):
+        return cls(
+            data["boxes"], data["scores"], data["class_ids"],
+            data["labels"], data["photo"], data["flags"],
+        )
+
+    def to_dicts(self) -> list:
+        """One dict per box in the format the frontend reads (label, confidence, bbox, isCrack, ...)"""
+        # Same rounding as the compact form, so both serializations agree
+        boxes = np.round(self.boxes.astype(np.float64), 1).tolist()
+        scores = np.round(self.scores.astype(np.float64), 4).tolist()
+        labels = self.label_names.tolist()
+        cracks = self.is_crack.tolist()
+        calibrations = self.is_calibration.tolist()
+        photos = self.photo.tolist()
+        return [
+            {
+                "label": labels[i],
+                "confidence": scores[i],
+                "bbox": boxes[i],
+                "isCrack": cracks[i],
+                "isCalibration": calibrations[i],
+                "photo": photos[i],
+            }
+            for i in range(len(self))
+        ]
+
+    @classmethod
+    def from_dicts(cls, items: list):
+        """Build from the per-box dict format; entries without a bbox are skipped"""
+        items = [item for item in items if len(item.get("bbox") or []) >= 4]
+        labels = list(dict.fromkeys(str(item.get("label", "")) for item in items))
+        index = {label: i for i, label in enumerate(labels)}
+        return cls(
+            [item["bbox"][:4] for item in items],
+            [item.get("confidence", 1.0) for item in items],
+            [index[str(item.get("label", ""))] for item in items],
+            labels,
+            [item.get("photo", 0) for item in items],
+            [
+                (FLAG_CRACK if item.get("isCrack") else 0) | (FLAG_CALIBRATION if item.get("isCalibration") else 0)
+                for item in items
+            ],
+        )
+
+
+def _column(value, n, dtype):
+    """Per-row column from an array, a scalar applied to every row, or None (zeros)"""
+    if value is None:
+        return np.zeros(n, dtype)
+    if np.isscalar(value):
+        return np.full(n, value, dtype)
+    return np.asarray(value, dtype)
+
+
+def expand_stored(value):
+    """
+    Per-box dicts from a stored ai_detections value, which is either the compact
+    form or a list of dicts written before the compact form existed.
+    """
+    if not value:
+        return []
+    if isinstance(value, dict) and value.get("format") == COMPACT_FORMAT:
+        return Detections.from_compact(value).to_dicts()
+    return value
@@ -0,0 +1,94 @@
+"""
+VisionEstate - Gemini Verdict Cache
+Persistent cache of parsed Gemini crack verdicts keyed by the content hash of the image sent,
+the model name and a hash of the prompt text, with a time-to-live. A photo already judged
+with the same model and prompt is never sent (and paid for) again until its verdict expires.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+from sqlite_cache import CacheDB
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GEMINI_CACHE_ENABLED = os.getenv("GEMINI_CACHE_ENABLED", "1") == "1"
+GEMINI_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH") or os.path.join(SCRIPT_DIR, "gemini_cache.db")
+GEMINI_CACHE_TTL_HOURS = float(os.getenv("GEMINI_CACHE_TTL_HOURS", "720"))
+
+_db = CacheDB(GEMINI_CACHE_PATH, [
+    """
+    CREATE TABLE IF NOT EXISTS verdicts (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        verdict TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_verdicts_created_at ON verdicts(created_at)",
+])
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def verdict_key(content: bytes, model: str, prompt: str) -> str:
+    """SHA-256 of the image bytes sent, scoped to the model and prompt that judged them"""
+    return f"{hashlib.sha256(content).hexdigest()}:{model}:{prompt_hash(prompt)}"
+
+
+def _expiry_cutoff() -> float:
+    return time.time() - GEMINI_CACHE_TTL_HOURS * 3600
+
+
+def get(key: str):
+    """Cached verdict dict, or None when missing or expired"""
+    if not GEMINI_CACHE_ENABLED:
+        return None
+
+    conn = _db.connect()
+    try:
+        row = conn.execute("SELECT verdict, created_at FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row and row[1] < _expiry_cutoff():
+            conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+            _db.increment(conn, "expired")
+            row = None
+        _db.increment(conn, "hits" if row else "misses")
+        conn.commit()
+    finally:
+        conn.close()
+
+    return json.loads(row[0]) if row else None
+
+
+def put(key: str, model: str, verdict: dict):
+    """Store a parsed verdict and drop expired ones"""
+    if not GEMINI_CACHE_ENABLED:
+        return
+
+    conn = _db.connect()
+    try:
+        conn.execute("""
+            INSERT OR REPLACE INTO verdicts (key, model, verdict, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (key, model, json.dumps(verdict), time.time()))
+        expired = conn.execute("DELETE FROM verdicts WHERE created_at < ?", (_expiry_cutoff(),)).rowcount
+        if expired:
+            _db.increment(conn, "expired", expired)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def stats() -> dict:
+    """Hit/miss/expiry counters (shared by all processes) and the number of cached verdicts"""
+    if not GEMINI_CACHE_ENABLED:
+        return {"enabled": False}
+    return {**_db.stats("verdicts", counters=("expired",)), "ttl_hours": GEMINI_CACHE_TTL_HOURS}
+
+
+def clear():
+    _db.clear("verdicts")
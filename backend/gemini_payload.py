@@ -0,0 +1,182 @@
+"""
+VisionEstate - Gemini Payload Builder
+Turns photos and their YOLO crack boxes into small Gemini uploads: the boxes are padded for
+context, merged where they overlap, cropped out of the full-resolution photo, downscaled and
+re-encoded as JPEG within a byte budget. Photos without crack boxes are not sent at all.
+
+With GEMINI_MOSAIC=1 the regions of a whole property are packed into numbered mosaic images,
+so several photos cost a single request.
+"""
+
+import os
+import math
+
+import cv2
+import numpy as np
+
+import image_io
+
+# Send crack regions instead of full photos whenever crack boxes are known (0/1)
+GEMINI_CROP_CRACKS = os.getenv("GEMINI_CROP_CRACKS", "1") == "1"
+
+# Context added around each box (fraction of its long side), and the smallest region sent in original pixels
+GEMINI_ROI_PADDING = float(os.getenv("GEMINI_ROI_PADDING", "0.5"))
+GEMINI_ROI_MIN_SIDE = int(os.getenv("GEMINI_ROI_MIN_SIDE", "256"))
+
+# Regions kept per photo after merging (the largest ones)
+GEMINI_ROI_MAX_PER_PHOTO = int(os.getenv("GEMINI_ROI_MAX_PER_PHOTO", "4"))
+
+# Long side of an uploaded crop, and the byte budget of every uploaded image
+GEMINI_PAYLOAD_MAX_SIDE = int(os.getenv("GEMINI_PAYLOAD_MAX_SIDE", "768"))
+GEMINI_PAYLOAD_MAX_BYTES = int(os.getenv("GEMINI_PAYLOAD_MAX_BYTES", "150000"))
+
+# Pack the regions of one property into mosaics of up to GEMINI_MOSAIC_MAX_TILES tiles (0/1)
+GEMINI_MOSAIC = os.getenv("GEMINI_MOSAIC", "0") == "1"
+GEMINI_MOSAIC_MAX_TILES = int(os.getenv("GEMINI_MOSAIC_MAX_TILES", "9"))
+GEMINI_MOSAIC_TILE_SIDE = int(os.getenv("GEMINI_MOSAIC_TILE_SIDE", "320"))
+
+_JPEG_QUALITIES = (90, 80, 70, 60, 50, 40)
+
+
+class Payload:
+    """
+    The images of one Gemini request and what they show. `tiles` holds (photo index, region)
+    per crop, regions being [x0, y0, x1, y1] in original-photo pixels; a mosaic packs every
+    tile into one image, otherwise each crop is its own image and all come from one photo.
+    """
+
+    def __init__(self, images, tiles, mosaic=False):
+        self.images = images
+        self.tiles = tiles
+        self.mosaic = mosaic
+
+    @property
+    def photos(self):
+        return sorted({photo for photo, _ in self.tiles})
+
+    @property
+    def size(self) -> int:
+        return sum(len(image) for image in self.images)
+
+
+# ==================== Regions ====================
+
+def _overlaps(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _within(center, half, limit):
+    """Span of 2 * half around center, shifted (then clipped) to stay inside [0, limit]"""
+    low, high = center - half, center + half
+    if low < 0:
+        low, high = 0.0, high - low
+    if high > limit:
+        low, high = low - (high - limit), float(limit)
+    return max(0.0, low), high
+
+
+def crack_regions(boxes, image_size):
+    """
+    Padded crack regions of one photo, merged until none overlap.
+    boxes are [x, y, width, height] and image_size (height, width), in original-photo pixels.
+    """
+    height, width = image_size
+    regions = []
+    for x, y, w, h in np.asarray(boxes, np.float64).reshape(-1, 4):
+        half_w = max(w / 2 + GEMINI_ROI_PADDING * max(w, h), GEMINI_ROI_MIN_SIDE / 2)
+        half_h = max(h / 2 + GEMINI_ROI_PADDING * max(w, h), GEMINI_ROI_MIN_SIDE / 2)
+        x0, x1 = _within(x + w / 2, half_w, width)
+        y0, y1 = _within(y + h / 2, half_h, height)
+        regions.append([x0, y0, x1, y1])
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if _overlaps(regions[i], regions[j]):
+                    a, b = regions[i], regions.pop(j)
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    regions.sort(key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
+    return [[int(round(v)) for v in region] for region in regions[:GEMINI_ROI_MAX_PER_PHOTO]]
+
+
+# ==================== Encoding ====================
+
+def _fit(img, max_side):
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        ratio = max_side / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * ratio)), max(1, round(h * ratio))), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def encode_jpeg(img, max_bytes=GEMINI_PAYLOAD_MAX_BYTES, max_side=GEMINI_PAYLOAD_MAX_SIDE) -> bytes:
+    """JPEG bytes of a BGR image at most max_side on its long side, lowering quality then size to fit max_bytes"""
+    img = _fit(img, max_side)
+    while True:
+        for quality in _JPEG_QUALITIES:
+            encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+            if len(encoded) <= max_bytes:
+                return encoded.tobytes()
+        if max(img.shape[:2]) <= 64:
+            # Nothing sensible fits; send the smallest attempt
+            return encoded.tobytes()
+        img = _fit(img, int(max(img.shape[:2]) * 0.75))
+
+
+def _mosaic(crops):
+    """Crops letterboxed into numbered square cells of a grid"""
+    side = GEMINI_MOSAIC_TILE_SIDE
+    cols = math.ceil(math.sqrt(len(crops)))
+    rows = math.ceil(len(crops) / cols)
+    canvas = np.full((rows * side, cols * side, 3), 127, np.uint8)
+    for n, crop in enumerate(crops):
+        tile = _fit(crop, side)
+        h, w = tile.shape[:2]
+        top = (n // cols) * side + (side - h) // 2
+        left = (n % cols) * side + (side - w) // 2
+        canvas[top:top + h, left:left + w] = tile
+        # Tile numbers match the ones the mosaic prompt asks about
+        origin = ((n % cols) * side + 6, (n // cols) * side + 30)
+        cv2.putText(canvas, str(n + 1), origin, cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 5, cv2.LINE_AA)
+        cv2.putText(canvas, str(n + 1), origin, cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
+    return canvas
+
+
+# ==================== Payloads ====================
+
+def build_payloads(sources, crack_boxes, mosaic=None):
+    """
+    Payloads for photos (paths, bytes or BGR arrays) with their crack boxes ([x, y, w, h] per
+    row, original pixels). Photos without boxes, or that cannot be read, are left out.
+    """
+    mosaic = GEMINI_MOSAIC if mosaic is None else mosaic
+    payloads = []
+    tiles = []
+    crops = []
+    for photo, (source, boxes) in enumerate(zip(sources, crack_boxes)):
+        if boxes is None or len(boxes) == 0:
+            continue
+        img = image_io.read_image(source)
+        if img is None:
+            continue
+
+        regions = crack_regions(boxes, img.shape[:2])
+        photo_crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in regions]
+        if mosaic:
+            tiles.extend((photo, region) for region in regions)
+            crops.extend(photo_crops)
+        else:
+            payloads.append(Payload([encode_jpeg(crop) for crop in photo_crops], [(photo, r) for r in regions]))
+
+    for start in range(0, len(crops), max(GEMINI_MOSAIC_MAX_TILES, 1)):
+        chunk = crops[start:start + GEMINI_MOSAIC_MAX_TILES]
+        image = encode_jpeg(_mosaic(chunk), max_side=None)
+        payloads.append(Payload([image], tiles[start:start + GEMINI_MOSAIC_MAX_TILES], mosaic=True))
+    return payloads
@@ -1,51 +1,66 @@
 """
 VisionEstate - Gemini AI Crack Verification
 Uses Google Gemini Vision API to verify if detected cracks are real or decorative patterns.
+
+Calls go to the Gemini REST API (generateContent) through one shared HTTP client on a
+background event loop, so every caller in the process shares the same connection pool,
+concurrency limit and rate limit. A listing's photos are verified concurrently. When the
+YOLO crack boxes are known, only the crack regions are sent (gemini_payload).
+
+Point GEMINI_API_ENDPOINT at a local stub to develop and test without the real API:
+    python gemini_verifier.py stub --port 8765 --latency-ms 300 --fail-rate 0.2
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765 python gemini_verifier.py verify photo1.jpg photo2.jpg
 """
 
 import os
-import base64
+import io
 import json
-from typing import Optional, Tuple
-import google.generativeai as genai
+import time
+import base64
+import random
+import asyncio
+import argparse
+import threading
+from collections import deque
+
+import httpx
+import numpy as np
 from PIL import Image
-import io
+
+import gemini_cache
+import gemini_payload
 
 # Load API key from environment
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
-def configure_gemini(api_key: str = None):
-    """Configure Gemini API with the provided key"""
-    key = api_key or GEMINI_API_KEY
-    if not key:
-        raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY environment variable.")
-    genai.configure(api_key=key)
-    return True
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
+# Base URL of the Gemini API; point it at a local stub server for testing
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "https://generativelanguage.googleapis.com").rstrip("/")
 
-def analyze_crack_with_gemini(image_path: str, api_key: str = None) -> dict:
-    """
-    Use Gemini Vision to analyze if a detected crack is real or a decorative pattern.
-    
-    Args:
-        image_path: Path to the image file
-        api_key: Optional Gemini API key (uses env var if not provided)
-    
-    Returns:
-        dict with crack analysis results
-    """
-    try:
-        # Configure Gemini
-        configure_gemini(api_key)
-        
-        # Load and prepare image
-        img = Image.open(image_path)
-        
-        # Use Gemini Pro Vision model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Craft the prompt for crack analysis
-        prompt = """Analyze this property image carefully. I need you to determine:
+# Requests in flight at once, across every caller in the process
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+
+# Token bucket: sustained requests per second and the burst allowed on top of it
+GEMINI_RATE_PER_SECOND = float(os.getenv("GEMINI_RATE_PER_SECOND", "2"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "4"))
+
+# Timeout of one attempt, and retries (with jittered exponential backoff) after timeouts,
+# connection errors, 429 and 5xx responses
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "0.5"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "8"))
+
+# Consecutive failed calls that open the circuit (0 disables it), and how long it stays open
+# before a single trial call decides whether to close it again
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_COOLDOWN_S = float(os.getenv("GEMINI_BREAKER_COOLDOWN_S", "60"))
+
+# Number of recent calls the latency percentiles are computed over
+METRICS_WINDOW = 1024
+
+CRACK_PROMPT = """Analyze this property image carefully. I need you to determine:
 
 1. Are there any cracks or structural defects visible in this image?
 2. If there are lines or patterns on the walls/surfaces, are they:
@@ -65,93 +80,560 @@ Please respond in the following JSON format:
 
 Be conservative - only mark as a real crack if you are confident it's structural damage, not a design element.
 """
-        
-        # Generate response
-        response = model.generate_content([prompt, img])
-        
-        # Parse the response
-        response_text = response.text
-        
-        # Try to extract JSON from response
+
+CRACK_ROI_PROMPT = """These images are close-up crops of one property photo, showing the regions where an automatic detector flagged possible cracks. I need you to determine whether the lines or patterns in them are:
+   - REAL CRACKS (structural issues, damage, wear)
+   - DECORATIVE DESIGNS (intentional patterns, wallpaper designs, tiles, artistic elements)
+   - NATURAL TEXTURES (wood grain, stone patterns, etc.)
+
+Please respond in the following JSON format:
+{
+    "is_real_crack": true/false,
+    "confidence": 0.0 to 1.0,
+    "description": "Brief description of what you see",
+    "severity": "none" / "minor" / "moderate" / "severe",
+    "crack_type": "structural" / "surface" / "decorative" / "none",
+    "recommendation": "What action should be taken"
+}
+
+Be conservative - only mark as a real crack if you are confident it's structural damage, not a design element.
+"""
+
+CRACK_MOSAIC_PROMPT = """This image is a grid of numbered tiles. Each tile is a close-up crop of a property photo, showing a region where an automatic detector flagged a possible crack. For every tile, determine whether the lines or patterns in it are:
+   - REAL CRACKS (structural issues, damage, wear)
+   - DECORATIVE DESIGNS (intentional patterns, wallpaper designs, tiles, artistic elements)
+   - NATURAL TEXTURES (wood grain, stone patterns, etc.)
+
+Please respond with a JSON array holding one object per tile, in the following format:
+[
+    {
+        "tile": tile number,
+        "is_real_crack": true/false,
+        "confidence": 0.0 to 1.0,
+        "description": "Brief description of what you see",
+        "severity": "none" / "minor" / "moderate" / "severe",
+        "crack_type": "structural" / "surface" / "decorative" / "none",
+        "recommendation": "What action should be taken"
+    }
+]
+
+Be conservative - only mark as a real crack if you are confident it's structural damage, not a design element.
+"""
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_SEVERITY_ORDER = {"none": 0, "minor": 1, "moderate": 2, "severe": 3}
+
+
+class GeminiError(Exception):
+    """A Gemini call that failed for good (after retries, or with a non-retryable error)"""
+
+
+class GeminiUnavailableError(GeminiError):
+    """Gemini unreachable, overloaded or failing (transport errors, 429, 5xx) after retries"""
+
+
+class CircuitOpenError(GeminiError):
+    """A call refused without contacting Gemini because the circuit is open"""
+
+
+def _parse_verdict(response_text: str):
+    """The JSON verdict in a Gemini reply, or None when it has none"""
+    try:
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        if start != -1 and end > start:
+            return json.loads(response_text[start:end])
+    except json.JSONDecodeError:
+        pass
+    return None
+
+
+def _parse_tile_verdicts(response_text: str):
+    """The JSON array of per-tile verdicts in a reply to a mosaic, or None when it has none"""
+    try:
+        start = response_text.find('[')
+        end = response_text.rfind(']') + 1
+        if start != -1 and end > start:
+            verdicts = json.loads(response_text[start:end])
+            return verdicts if isinstance(verdicts, list) else None
+    except json.JSONDecodeError:
+        pass
+    return None
+
+
+def _unparsed_verdict(response_text: str) -> dict:
+    return {
+        "is_real_crack": False,
+        "confidence": 0.5,
+        "description": response_text[:200] if response_text else "Could not parse response",
+        "severity": "none",
+        "crack_type": "none",
+        "recommendation": "Manual review recommended"
+    }
+
+
+def _failed(error: str) -> dict:
+    return {
+        "success": False,
+        "error": error,
+        "data": {
+            "is_real_crack": False,
+            "confidence": 0.0,
+            "description": f"Gemini analysis failed: {error}",
+            "severity": "unknown",
+            "crack_type": "unknown",
+            "recommendation": "Manual inspection required"
+        }
+    }
+
+
+def _read_image(image_path: str):
+    """(bytes, mime type) of an image file as uploaded to Gemini"""
+    with open(image_path, "rb") as f:
+        content = f.read()
+    with Image.open(io.BytesIO(content)) as img:
+        mime_type = Image.MIME.get(img.format, "image/jpeg")
+    return content, mime_type
+
+
+# ==================== Rate Limiting ====================
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` back to back"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# ==================== Circuit Breaker ====================
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and then refuses calls for `cooldown`
+    seconds. After that one trial call is let through (half-open): success closes the circuit,
+    failure opens it for another cooldown. Only outages count as failures, so one caller's bad
+    key cannot open it for everyone. Only used from the Gemini loop, so it needs no lock.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.times_opened = 0
+        self.short_circuited = 0
+        self._open_seconds = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    @property
+    def open_seconds(self) -> float:
+        """Total time the circuit has spent open (or half-open)"""
+        current = time.monotonic() - self.opened_at if self.opened_at is not None else 0.0
+        return self._open_seconds + current
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def release(self):
+        """End a call that says nothing about Gemini's health (e.g. a rejected API key)"""
+        self.trial_running = False
+
+    def record(self, success: bool):
+        self.trial_running = False
+        now = time.monotonic()
+        if success:
+            if self.opened_at is not None:
+                self._open_seconds += now - self.opened_at
+                self.opened_at = None
+                print("Gemini circuit closed")
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.opened_at is not None:
+            # The trial call failed: stay open for another cooldown
+            self._open_seconds += now - self.opened_at
+            self.opened_at = now
+        elif self.threshold and self.failures >= self.threshold:
+            self.opened_at = now
+            self.times_opened += 1
+            print(f"Gemini circuit opened after {self.failures} consecutive failures")
+
+
+# ==================== Client ====================
+
+class GeminiClient:
+    """One HTTP client, concurrency limit and rate limit for every Gemini call in the process"""
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            base_url=GEMINI_API_ENDPOINT,
+            timeout=GEMINI_TIMEOUT_S,
+            limits=httpx.Limits(max_connections=max(GEMINI_CONCURRENCY, 1)),
+        )
+        self.slots = asyncio.Semaphore(max(GEMINI_CONCURRENCY, 1))
+        self.bucket = TokenBucket(GEMINI_RATE_PER_SECOND, GEMINI_BURST) if GEMINI_RATE_PER_SECOND > 0 else None
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN_S)
+
+        self._latencies_ms = deque(maxlen=METRICS_WINDOW)
+        # Failed calls are timed apart, so timeouts and 5xx do not hide in (or skew) the success figures
+        self._failure_latencies_ms = deque(maxlen=METRICS_WINDOW)
+        self._calls = 0
+        self._failures = 0
+        self._retries = 0
+
+    async def generate(self, parts: list, api_key: str) -> str:
+        """Text of the model's reply to `parts`; fails fast while the circuit is open"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gemini circuit open after repeated failures; call skipped")
+
+        self._calls += 1
+        started = time.perf_counter()
         try:
-            # Find JSON in response
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            if start != -1 and end > start:
-                json_str = response_text[start:end]
-                result = json.loads(json_str)
+            text = await self._generate(parts, api_key)
+        except Exception as e:
+            self._failures += 1
+            self._failure_latencies_ms.append((time.perf_counter() - started) * 1000)
+            if isinstance(e, GeminiUnavailableError):
+                self.breaker.record(success=False)
             else:
-                # Fallback parsing
-                result = {
-                    "is_real_crack": False,
-                    "confidence": 0.5,
-                    "description": response_text[:200],
-                    "severity": "none",
-                    "crack_type": "none",
-                    "recommendation": "Manual review recommended"
-                }
-        except json.JSONDecodeError:
-            result = {
-                "is_real_crack": False,
-                "confidence": 0.5,
-                "description": response_text[:200] if response_text else "Could not parse response",
-                "severity": "none",
-                "crack_type": "none",
-                "recommendation": "Manual review recommended"
-            }
-        
+                # Either another call opened the circuit while this one was retrying (that call
+                # was counted), or Gemini answered but refused the request (bad key) or the reply
+                self.breaker.release()
+            raise
+        self.breaker.record(success=True)
+        self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        return text
+
+    async def _generate(self, parts: list, api_key: str) -> str:
+        """One call, retrying transient failures"""
+        body = {"contents": [{"parts": parts}]}
+        path = f"/v1beta/models/{GEMINI_MODEL}:generateContent"
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            retry_after = None
+            if attempt and self.breaker.state == "open":
+                raise CircuitOpenError(f"Gemini circuit opened while retrying; last error: {error}")
+            async with self.slots:
+                if self.bucket is not None:
+                    await self.bucket.acquire()
+                try:
+                    response = await self.http.post(path, json=body, headers={"x-goog-api-key": api_key})
+                except httpx.TransportError as e:  # timeouts and connection errors
+                    error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                else:
+                    if response.status_code == 200:
+                        return _response_text(response.json())
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    if response.status_code not in _RETRY_STATUS:
+                        raise GeminiError(error)
+                    retry_after = response.headers.get("retry-after")
+
+            if attempt == GEMINI_MAX_RETRIES:
+                break
+            # Full jitter keeps a burst of failed calls from retrying in lockstep
+            delay = random.uniform(0, min(GEMINI_BACKOFF_MAX_S, GEMINI_BACKOFF_BASE_S * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            self._retries += 1
+            await asyncio.sleep(delay)
+        raise GeminiUnavailableError(f"{error} (after {GEMINI_MAX_RETRIES + 1} attempts)")
+
+    def stats(self) -> dict:
         return {
-            "success": True,
-            "data": result
+            "calls": self._calls,
+            "successes": self._calls - self._failures,
+            "failures": self._failures,
+            "retries": self._retries,
+            "short_circuited": self.breaker.short_circuited,
+            **_percentiles("latency_ms", self._latencies_ms),
+            # Includes the time spent on retries before giving up
+            **_percentiles("failure_latency_ms", self._failure_latencies_ms),
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.times_opened,
+                "open_seconds": round(self.breaker.open_seconds, 1),
+            },
         }
-        
+
+    async def close(self):
+        await self.http.aclose()
+
+
+def _percentiles(prefix: str, samples) -> dict:
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        f"{prefix}_{name}": round(float(np.percentile(samples, q)), 1) if len(samples) else None
+        for name, q in (("p50", 50), ("p95", 95))
+    }
+
+
+def _response_text(payload: dict) -> str:
+    candidates = payload.get("candidates") or []
+    if not candidates:
+        raise GeminiError(f"No candidates in Gemini response: {json.dumps(payload)[:200]}")
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+# The client lives on its own event loop thread, so sync callers (analysis threads) and async
+# endpoints share it; an httpx client must stay on the loop it was created on
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def _gemini_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="gemini", daemon=True).start()
+    return _loop
+
+
+def _get_client() -> GeminiClient:
+    """Called on the Gemini loop only"""
+    global _client
+    if _client is None:
+        _client = GeminiClient()
+    return _client
+
+
+def _submit(coro):
+    """Run a coroutine on the Gemini loop; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _gemini_loop())
+
+
+async def _client_stats():
+    return _get_client().stats()
+
+
+def stats() -> dict:
+    """Call, failure and latency counters and circuit state of this process's Gemini client"""
+    return _submit(_client_stats()).result(timeout=5)
+
+
+async def stats_async() -> dict:
+    """Async variant of stats, for event loop callers"""
+    return await asyncio.wait_for(asyncio.wrap_future(_submit(_client_stats())), timeout=5)
+
+
+def close():
+    """Close the shared HTTP client (server shutdown)"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        _submit(client.close()).result(timeout=5)
+
+
+# ==================== Verification ====================
+
+async def _judge(images: list, prompt: str, api_key: str, parse=None) -> dict:
+    """
+    One Gemini request for encoded images [(bytes, mime type)], answered from the verdict
+    cache when these exact bytes were already judged with this model and prompt.
+    """
+    parse = parse or _parse_verdict
+    try:
+        cache_key = gemini_cache.verdict_key(b"".join(content for content, _ in images), GEMINI_MODEL, prompt)
+        cached = await asyncio.to_thread(gemini_cache.get, cache_key)
+        if cached is not None:
+            return {"success": True, "cached": True, "data": cached}
+
+        key = api_key or GEMINI_API_KEY
+        if not key:
+            return _failed("Gemini API key not provided. Set GEMINI_API_KEY environment variable.")
+        parts = [{"text": prompt}] + [
+            {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(content).decode("ascii")}}
+            for content, mime_type in images
+        ]
+        response_text = await _get_client().generate(parts, key)
     except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "data": {
-                "is_real_crack": False,
-                "confidence": 0.0,
-                "description": f"Gemini analysis failed: {str(e)}",
-                "severity": "unknown",
-                "crack_type": "unknown",
-                "recommendation": "Manual inspection required"
-            }
-        }
+        return _failed(str(e))
+
+    verdict = parse(response_text)
+    if verdict is None:
+        # Unparseable replies are not cached, so the photo is judged again next time
+        return {"success": True, "data": _unparsed_verdict(response_text)}
+    await asyncio.to_thread(gemini_cache.put, cache_key, GEMINI_MODEL, verdict)
+    return {
+        "success": True,
+        "data": verdict
+    }
+
+
+async def _analyze(image_path: str, api_key: str) -> dict:
+    try:
+        image = await asyncio.to_thread(_read_image, image_path)
+    except Exception as e:
+        return _failed(str(e))
+    return await _judge([image], CRACK_PROMPT, api_key)
+
+
+async def _verify(image_paths: list, api_key: str, crack_boxes=None) -> dict:
+    if crack_boxes is not None and gemini_payload.GEMINI_CROP_CRACKS:
+        return await _verify_regions(image_paths, crack_boxes, api_key)
+    paths = [path for path in image_paths if os.path.exists(path)]
+    analyses = await asyncio.gather(*(_analyze(path, api_key) for path in paths))
+    return _aggregate(paths, analyses)
+
+
+def _tile_results(result: dict, count: int) -> list:
+    """Per-tile results of a mosaic request; a reply without per-tile verdicts applies to every tile"""
+    verdicts = result["data"]
+    if not isinstance(verdicts, list):
+        return [result] * count
+    by_tile = {}
+    for position, verdict in enumerate(verdicts):
+        if isinstance(verdict, dict):
+            tile = verdict.get("tile")
+            by_tile[int(tile) - 1 if isinstance(tile, (int, float)) else position] = verdict
+    return [
+        {**result, "data": by_tile.get(n) or _unparsed_verdict("No verdict for this tile")}
+        for n in range(count)
+    ]
+
+
+def _worst(results: list) -> dict:
+    """The most severe real-crack verdict among a photo's results, else its first successful one"""
+    real = [r for r in results if r["success"] and r["data"].get("is_real_crack")]
+    if real:
+        return max(real, key=lambda r: _SEVERITY_ORDER.get(r["data"].get("severity", "none"), 0))
+    return next((r for r in results if r["success"]), results[0])
 
 
-def verify_property_images(image_paths: list, api_key: str = None) -> dict:
+async def _verify_regions(image_paths: list, crack_boxes: list, api_key: str) -> dict:
+    """Send only the crack regions of photos that have crack boxes"""
+    payloads = await asyncio.to_thread(gemini_payload.build_payloads, image_paths, crack_boxes)
+    analyses = await asyncio.gather(*(
+        _judge(
+            [(image, "image/jpeg") for image in payload.images],
+            CRACK_MOSAIC_PROMPT if payload.mosaic else CRACK_ROI_PROMPT,
+            api_key,
+            _parse_tile_verdicts if payload.mosaic else _parse_verdict,
+        )
+        for payload in payloads
+    ))
+
+    per_photo = {}
+    for payload, result in zip(payloads, analyses):
+        if payload.mosaic:
+            for (photo, _), tile_result in zip(payload.tiles, _tile_results(result, len(payload.tiles))):
+                per_photo.setdefault(photo, []).append(tile_result)
+        else:
+            per_photo.setdefault(payload.photos[0], []).append(result)
+
+    photos = sorted(per_photo)
+    aggregated = _aggregate([image_paths[photo] for photo in photos], [_worst(per_photo[photo]) for photo in photos])
+    aggregated["requests"] = len(payloads)
+    aggregated["upload_bytes"] = sum(
+        payload.size for payload, result in zip(payloads, analyses) if not result.get("cached")
+    )
+    return aggregated
+
+
+def configure_gemini(api_key: str = None):
+    """Make api_key the default key for calls that do not pass one (requests are sent with their key)"""
+    global GEMINI_API_KEY
+    key = api_key or GEMINI_API_KEY
+    if not key:
+        raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY environment variable.")
+    GEMINI_API_KEY = key
+    return True
+
+
+def analyze_crack_with_gemini(image_path: str, api_key: str = None) -> dict:
+    """
+    Use Gemini Vision to analyze if a detected crack is real or a decorative pattern.
+
+    Args:
+        image_path: Path to the image file
+        api_key: Optional Gemini API key (uses env var if not provided)
+
+    Returns:
+        dict with crack analysis results
+    """
+    return _submit(_analyze(image_path, api_key)).result()
+
+
+async def analyze_crack_with_gemini_async(image_path: str, api_key: str = None) -> dict:
+    """Async variant of analyze_crack_with_gemini"""
+    return await asyncio.wrap_future(_submit(_analyze(image_path, api_key)))
+
+
+def verify_property_images(image_paths: list, api_key: str = None, crack_boxes: list = None) -> dict:
     """
     Analyze multiple property images for cracks using Gemini.
-    
+    The images are sent concurrently, within GEMINI_CONCURRENCY and the rate limit.
+
     Args:
         image_paths: List of paths to image files
         api_key: Optional Gemini API key
-    
+        crack_boxes: Optional YOLO crack boxes per image ([x, y, w, h] rows in original pixels);
+            when given, only the crack regions of images that have boxes are sent
+
     Returns:
         Aggregated analysis results
     """
+    return _submit(_verify(image_paths, api_key, crack_boxes)).result()
+
+
+async def verify_property_images_async(image_paths: list, api_key: str = None, crack_boxes: list = None) -> dict:
+    """Async variant of verify_property_images, for callers on an event loop"""
+    return await asyncio.wrap_future(_submit(_verify(image_paths, api_key, crack_boxes)))
+
+
+def _aggregate(paths: list, analyses: list) -> dict:
     results = []
     has_real_crack = False
     max_severity = "none"
-    severity_order = {"none": 0, "minor": 1, "moderate": 2, "severe": 3}
-    
-    for path in image_paths:
-        if os.path.exists(path):
-            result = analyze_crack_with_gemini(path, api_key)
-            results.append({
-                "image": os.path.basename(path),
-                "analysis": result
-            })
-            
-            if result["success"] and result["data"].get("is_real_crack"):
-                has_real_crack = True
-                img_severity = result["data"].get("severity", "none")
-                if severity_order.get(img_severity, 0) > severity_order.get(max_severity, 0):
-                    max_severity = img_severity
-    
+
+    for path, result in zip(paths, analyses):
+        results.append({
+            "image": os.path.basename(path),
+            "analysis": result
+        })
+
+        if result["success"] and result["data"].get("is_real_crack"):
+            has_real_crack = True
+            img_severity = result["data"].get("severity", "none")
+            if _SEVERITY_ORDER.get(img_severity, 0) > _SEVERITY_ORDER.get(max_severity, 0):
+                max_severity = img_severity
+
     return {
         "images_analyzed": len(results),
+        # Verdicts served from gemini_cache instead of a paid call
+        "images_cached": sum(1 for result in analyses if result.get("cached")),
         "has_real_crack": has_real_crack,
         "max_severity": max_severity,
         "detailed_results": results,
@@ -163,7 +645,7 @@ def get_recommendation(has_crack: bool, severity: str) -> str:
     """Generate recommendation based on crack analysis"""
     if not has_crack:
         return "No structural issues detected. Property appears to be in good condition."
-    
+
     if severity == "minor":
         return "Minor surface cracks detected. Regular maintenance recommended."
     elif severity == "moderate":
@@ -174,8 +656,68 @@ def get_recommendation(has_crack: bool, severity: str) -> str:
         return "Cracks detected. Further inspection may be needed."
 
 
-# Quick test function
+# ==================== Stub Server ====================
+
+def run_stub_server(port: int, latency_ms: float = 0, fail_rate: float = 0.0):
+    """
+    Minimal stand-in for the generateContent endpoint, answering every request with a canned
+    verdict after `latency_ms`; a `fail_rate` share of requests gets a 503 instead.
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    verdict = {
+        "is_real_crack": True,
+        "confidence": 0.8,
+        "description": "Stub verdict",
+        "severity": "minor",
+        "crack_type": "surface",
+        "recommendation": "Stub response - no real analysis"
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency_ms / 1000)
+            if not self.path.endswith(":generateContent") or not self.headers.get("x-goog-api-key"):
+                self._reply(400, {"error": {"message": "bad request"}})
+            elif random.random() < fail_rate:
+                self._reply(503, {"error": {"message": "stub overloaded"}})
+            else:
+                text = json.dumps({**verdict, "request_bytes": len(body)})
+                if b"numbered tiles" in body:
+                    text = json.dumps([{**verdict, "tile": n, "request_bytes": len(body)} for n in range(1, 10)])
+                self._reply(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Gemini stub listening on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
 if __name__ == "__main__":
-    # Test with a sample image
-    print("Gemini Crack Verifier - Ready")
-    print("Set GEMINI_API_KEY environment variable before using.")
+    parser = argparse.ArgumentParser(description="Gemini crack verification")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser("verify", help="Verify images and print the aggregated result")
+    verify_parser.add_argument("images", nargs="+")
+    stub_parser = subparsers.add_parser("stub", help="Run a local stand-in for the Gemini API")
+    stub_parser.add_argument("--port", type=int, default=8765)
+    stub_parser.add_argument("--latency-ms", type=float, default=0)
+    stub_parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        run_stub_server(args.port, args.latency_ms, args.fail_rate)
+    else:
+        started = time.perf_counter()
+        print(json.dumps(verify_property_images(args.images), indent=2))
+        print(f"Verified {len(args.images)} images in {time.perf_counter() - started:.2f}s")
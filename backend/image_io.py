@@ -0,0 +1,140 @@
+"""
+VisionEstate - Image Decoding
+Decodes photos straight to the resolution the analyzer models need, using JPEG DCT scaling.
+"""
+
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Smallest (short side, long side) any analyzer model needs: SegFormer takes 512x512, YOLO 640
+MODEL_INPUT_MIN_SIZE = (
+    int(os.getenv("ANALYZER_DECODE_MIN_SHORT_SIDE", "512")),
+    int(os.getenv("ANALYZER_DECODE_MIN_LONG_SIDE", "640")),
+)
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# EXIF orientations that swap width and height once applied
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class DecodedImage:
+    """
+    A photo decoded at reduced resolution plus what is needed to map back to full size.
+
+    `image` is the BGR working buffer every model input is built from; `scale_x`/`scale_y`
+    convert its pixel coordinates to the original photo's. The full-resolution image is
+    only decoded when `full_resolution()` is called.
+    """
+
+    def __init__(self, image, orig_size, data=None, full_image=None, content=None):
+        self.image = image
+        self.orig_size = orig_size  # (height, width) of the original photo
+        self._data = data
+        self._full_image = full_image
+        # Encoded bytes the photo was decoded from, when known (identifies it for caching)
+        self.content = content
+
+        h, w = image.shape[:2]
+        self.scale_y = orig_size[0] / h
+        self.scale_x = orig_size[1] / w
+
+    @property
+    def is_reduced(self) -> bool:
+        return self.scale_x > 1.0 or self.scale_y > 1.0
+
+    def full_resolution(self):
+        """Decode the full-size image on demand (not cached, so it can be freed right away)"""
+        if not self.is_reduced:
+            return self.image
+        if self._full_image is not None:
+            return self._full_image
+        return cv2.imdecode(np.frombuffer(self._data, np.uint8), cv2.IMREAD_COLOR)
+
+    def at_most(self, max_side: int):
+        """
+        The photo at the highest resolution whose long side is at most max_side (but never below
+        the working image), decoding only as much of a JPEG as needed. Not cached either.
+        """
+        if max(self.orig_size) <= max_side:
+            return self.full_resolution()
+        if max(self.image.shape[:2]) >= max_side:
+            return self.image
+
+        if self._data is not None:
+            factor = next((f for f in (1, 2, 4) if max(self.orig_size) / f <= max_side), 8)
+            img = cv2.imdecode(np.frombuffer(self._data, np.uint8), _REDUCED_FLAGS[factor])
+        else:
+            img = self._full_image
+
+        h, w = img.shape[:2]
+        if max(h, w) > max_side:
+            ratio = max_side / max(h, w)
+            img = cv2.resize(img, (round(w * ratio), round(h * ratio)), interpolation=cv2.INTER_AREA)
+        return img
+
+
+def reduction_factor(orig_size, min_size=MODEL_INPUT_MIN_SIZE) -> int:
+    """Largest DCT scale factor (1, 2, 4 or 8) that keeps the image at least min_size"""
+    short_side, long_side = min(orig_size), max(orig_size)
+    for factor in (8, 4, 2):
+        if short_side / factor >= min_size[0] and long_side / factor >= min_size[1]:
+            return factor
+    return 1
+
+
+def _header_size(data: bytes):
+    """(height, width) from the image header as it will be decoded (EXIF rotation applied)"""
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            w, h = header.size
+            orientation = header.getexif().get(0x0112, 1)
+    except Exception:
+        return None
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        w, h = h, w
+    return h, w
+
+
+def decode_bytes(data: bytes, min_size=MODEL_INPUT_MIN_SIZE):
+    """Decode encoded image bytes at the smallest resolution that still satisfies min_size"""
+    buffer = np.frombuffer(data, np.uint8)
+    orig_size = _header_size(data)
+    factor = reduction_factor(orig_size, min_size) if orig_size else 1
+
+    img = cv2.imdecode(buffer, _REDUCED_FLAGS[factor])
+    if img is None:
+        return None
+    if factor == 1 or orig_size is None:
+        return DecodedImage(img, img.shape[:2], content=data)
+    return DecodedImage(img, orig_size, data=data, content=data)
+
+
+def from_array(img, min_size=MODEL_INPUT_MIN_SIZE):
+    """Wrap an already decoded BGR array, downscaling the working copy when it is larger than needed"""
+    orig_size = img.shape[:2]
+    factor = reduction_factor(orig_size, min_size)
+    if factor == 1:
+        return DecodedImage(img, orig_size)
+
+    h, w = orig_size
+    small = cv2.resize(img, (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+    return DecodedImage(small, orig_size, full_image=img)
+
+
+def read_image(source):
+    """Full-resolution BGR array from a file path, encoded image bytes or an already decoded array"""
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
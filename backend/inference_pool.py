@@ -0,0 +1,214 @@
+"""
+VisionEstate - Inference Worker Pool
+Runs the CPU-heavy analyzer in worker processes so the API event loop stays responsive,
+or hands it to separate inference servers (inference_server.py) when INFERENCE_SERVER is set.
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Number of inference worker processes; 0 runs inference in a background thread of the API process
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+# Analyses run concurrently in thread mode; with MICROBATCH=1 their forward passes share batches
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "1"))
+
+# Torch intra-op threads per worker; 0 splits the CPU cores evenly between workers
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", "0"))
+
+# Load every model as soon as a worker starts instead of on its first analysis
+INFERENCE_WARMUP = os.getenv("INFERENCE_WARMUP", "1") == "1"
+
+# Load the models in this process and fork inference workers from it, so every worker shares
+# one copy of the weights (also shares them between `gunicorn --preload` uvicorn workers)
+INFERENCE_PRELOAD = os.getenv("INFERENCE_PRELOAD", "0") == "1"
+
+# Inference servers (host:port, comma-separated); empty runs inference from this process
+INFERENCE_SERVERS = [a.strip() for a in os.getenv("INFERENCE_SERVER", "").split(",") if a.strip()]
+
+# How long a worker that finished its warmup waits for the others (see warmup())
+WARMUP_BARRIER_TIMEOUT_S = 600
+
+_executor = None
+_client = None
+_warmup_barrier = None
+
+
+def torch_threads_per_worker() -> int:
+    if INFERENCE_TORCH_THREADS > 0:
+        return INFERENCE_TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // max(INFERENCE_WORKERS, 1))
+
+
+# ==================== Worker Side ====================
+
+def _init_worker(torch_threads: int, warmup: bool, warmup_barrier=None):
+    """Runs once in every worker process before it accepts tasks"""
+    global _warmup_barrier
+    import torch
+    torch.set_num_threads(torch_threads)
+    _warmup_barrier = warmup_barrier
+
+    if warmup:
+        import model_registry
+        model_registry.warmup()
+
+
+def _run_detect_defects_batch(images, kwargs):
+    from analyzer import detect_defects_batch
+    return detect_defects_batch(images, **kwargs)
+
+
+def _run_warmup(names=None):
+    import threading
+    import model_registry
+    stats = model_registry.warmup(names)
+    stats["pid"] = os.getpid()
+    if _warmup_barrier is not None:
+        # A worker blocked here cannot take another warmup task, so the tasks of one
+        # warmup() call pass the barrier on as many different processes as there are workers
+        try:
+            _warmup_barrier.wait(timeout=WARMUP_BARRIER_TIMEOUT_S)
+        except threading.BrokenBarrierError:
+            # A worker was busy or gone; the others still report their own state
+            _warmup_barrier.reset()
+    return stats
+
+
+def _run_model_stats():
+    import model_registry
+    import micro_batcher
+    stats = model_registry.model_stats()
+    stats["micro_batching"] = micro_batcher.stats()
+    stats["pid"] = os.getpid()
+    return stats
+
+
+# ==================== API Side ====================
+
+def preload():
+    """Load the default models before workers are forked (INFERENCE_PRELOAD); call at import time"""
+    if INFERENCE_SERVERS:
+        print("INFERENCE_PRELOAD has no effect with INFERENCE_SERVER set; models live in the servers")
+        return None
+
+    import torch
+    import model_registry
+    # Single-threaded so no OpenMP thread pool exists yet at fork time; forked children
+    # cannot use one inherited from the parent
+    torch.set_num_threads(1)
+    stats = model_registry.preload()
+    print(f"Preloaded models for forked workers ({stats['process_rss_mb']} MB RSS)")
+    return stats
+
+
+def init_preloaded_process():
+    """Restore the torch thread budget in a process forked after preload()"""
+    if INFERENCE_PRELOAD and not INFERENCE_SERVERS:
+        import torch
+        torch.set_num_threads(torch_threads_per_worker())
+
+
+def _remote():
+    """Client for the inference servers, created on first use"""
+    global _client
+    if _client is None:
+        from inference_server import InferenceClient
+        _client = InferenceClient(INFERENCE_SERVERS)
+    return _client
+
+
+def _remote_detect_defects_batch(images, kwargs):
+    return _remote().detect_defects_batch(images, **kwargs)
+
+
+def get_executor():
+    """Create the executor on first use so importing this module stays cheap"""
+    global _executor
+    if _executor is None:
+        if INFERENCE_SERVERS:
+            # Threads only wait on the servers' replies
+            _executor = ThreadPoolExecutor(thread_name_prefix="inference-client")
+        elif INFERENCE_WORKERS <= 0:
+            _executor = ThreadPoolExecutor(max_workers=max(INFERENCE_THREADS, 1), thread_name_prefix="inference")
+        else:
+            # spawn, not fork: forking a process with initialised torch thread pools can deadlock.
+            # After preload() no pool exists yet, and forking shares the loaded weights
+            context = multiprocessing.get_context("fork" if INFERENCE_PRELOAD else "spawn")
+            _executor = ProcessPoolExecutor(
+                max_workers=INFERENCE_WORKERS,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(torch_threads_per_worker(), INFERENCE_WARMUP, context.Barrier(INFERENCE_WORKERS)),
+            )
+    return _executor
+
+
+async def _submit(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fn, *args)
+
+
+async def detect_defects_batch_async(images, **kwargs):
+    """Await analyzer.detect_defects_batch running in the inference pool or on a server"""
+    if INFERENCE_SERVERS:
+        return await _submit(_remote_detect_defects_batch, list(images), kwargs)
+    return await _submit(_run_detect_defects_batch, list(images), kwargs)
+
+
+async def warmup(names: list = None) -> dict:
+    """
+    Load the given models (default: those the default analysis uses) in every worker
+    (in-process when running without workers) or server
+    """
+    if INFERENCE_SERVERS:
+        results = await _submit(_remote().broadcast, "warmup", names)
+        return results[-1]
+    # One task per worker, held at a barrier so each lands on a different process
+    tasks = [_submit(_run_warmup, names) for _ in range(max(INFERENCE_WORKERS, 1))]
+    results = await asyncio.gather(*tasks)
+    stats = results[-1]
+    # Fewer pids than workers means a worker was busy past the barrier timeout and may be cold
+    stats["warm_worker_pids"] = sorted({result["pid"] for result in results})
+    return stats
+
+
+async def model_stats() -> dict:
+    """Pool configuration plus model load stats reported by one of the workers"""
+    if INFERENCE_SERVERS:
+        stats = await _submit(_remote().call, "model_stats")
+    else:
+        stats = await _submit(_run_model_stats)
+    stats["pool"] = pool_info()
+    return stats
+
+
+def memory_report() -> dict:
+    """Shared vs private memory of this process and its inference workers"""
+    import memory_report as report
+    return report.process_tree_report()
+
+
+def pool_info() -> dict:
+    if INFERENCE_SERVERS:
+        return {"mode": "server", "servers": INFERENCE_SERVERS, "started": _client is not None}
+    return {
+        "mode": "process" if INFERENCE_WORKERS > 0 else "thread",
+        "workers": max(INFERENCE_WORKERS, 1),
+        "threads": max(INFERENCE_THREADS, 1) if INFERENCE_WORKERS <= 0 else 1,
+        "torch_threads_per_worker": torch_threads_per_worker(),
+        "preloaded": INFERENCE_PRELOAD,
+        "started": _executor is not None,
+    }
+
+
+def shutdown():
+    global _executor, _client
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,220 @@
+"""
+VisionEstate - Inference Server
+Standalone process holding the analyzer models. The API talks to it over a local socket
+(multiprocessing.connection) and hands over decoded photos in shared memory, so the API
+process never imports torch, transformers or ultralytics.
+
+    python inference_server.py                          # listens on INFERENCE_SERVER_ADDRESS
+    python inference_server.py --address 127.0.0.1:6071 # a second server; list both in INFERENCE_SERVER
+
+Point the API at the server(s) with INFERENCE_SERVER=host:port[,host:port...]. Without it the
+API runs inference itself (inference_pool), which is the development setup.
+"""
+
+import os
+import argparse
+import ipaddress
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where a server listens by default
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "127.0.0.1:6070")
+
+# Shared secret for the connection handshake; requests are pickled, so keep servers on localhost.
+# The placeholder is only accepted on a loopback address.
+DEFAULT_AUTHKEY = "change-me"
+INFERENCE_SERVER_AUTHKEY = (os.getenv("INFERENCE_SERVER_AUTHKEY") or DEFAULT_AUTHKEY).encode()
+
+# Analyses one server runs concurrently; with MICROBATCH=1 their forward passes share batches
+INFERENCE_SERVER_THREADS = int(os.getenv("INFERENCE_SERVER_THREADS", "4"))
+
+
+def parse_address(address: str):
+    host, _, port = address.strip().rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+# ==================== Server ====================
+
+def _detect_defects_batch(descriptor, kwargs):
+    import shared_images
+    from analyzer import detect_defects_batch
+
+    shm, sources = shared_images.attach(descriptor)
+    try:
+        return detect_defects_batch(sources, **kwargs)
+    finally:
+        # Drop the views into the block before closing it
+        del sources
+        shared_images.release(shm)
+
+
+def _warmup(names=None):
+    import model_registry
+    return model_registry.warmup(names)
+
+
+def _model_stats():
+    import model_registry
+    import micro_batcher
+    stats = model_registry.model_stats()
+    stats["micro_batching"] = micro_batcher.stats()
+    stats["pid"] = os.getpid()
+    return stats
+
+
+HANDLERS = {
+    "detect_defects_batch": _detect_defects_batch,
+    "warmup": _warmup,
+    "model_stats": _model_stats,
+}
+
+
+def _serve_connection(conn, executor):
+    """Answer requests on one connection until the client closes it"""
+    with conn:
+        while True:
+            try:
+                command, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                result = executor.submit(HANDLERS[command], *args).result()
+                conn.send(("ok", result))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+
+
+def serve(address=INFERENCE_SERVER_ADDRESS, warmup=True):
+    import torch
+
+    host, port = parse_address(address)
+    if INFERENCE_SERVER_AUTHKEY == DEFAULT_AUTHKEY.encode() and not _is_loopback(host):
+        # Anyone who can connect can make the server unpickle arbitrary requests
+        raise RuntimeError(
+            f"Refusing to listen on {address} with the default INFERENCE_SERVER_AUTHKEY; "
+            "set a secret or listen on a loopback address"
+        )
+
+    # INFERENCE_TORCH_THREADS=0 gives one server every core; split them when running several
+    torch_threads = int(os.getenv("INFERENCE_TORCH_THREADS", "0")) or os.cpu_count() or 1
+    torch.set_num_threads(torch_threads)
+    if warmup:
+        _warmup()
+
+    executor = ThreadPoolExecutor(max_workers=max(INFERENCE_SERVER_THREADS, 1), thread_name_prefix="analysis")
+    with Listener((host, port), authkey=INFERENCE_SERVER_AUTHKEY) as listener:
+        print(f"Inference server listening on {address} (pid {os.getpid()}, "
+              f"{INFERENCE_SERVER_THREADS} analysis threads, {torch.get_num_threads()} torch threads)")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # A failed handshake (wrong authkey) must not take the server down
+                print(f"Rejected inference connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, executor), daemon=True).start()
+
+
+# ==================== Client ====================
+
+class InferenceClient:
+    """Blocking client for one or more servers; each call goes to the least busy server"""
+
+    def __init__(self, addresses):
+        self.addresses = [parse_address(a) for a in addresses]
+        self._idle = {address: [] for address in self.addresses}
+        self._in_flight = {address: 0 for address in self.addresses}
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        """(address, connection, reused) for the server with the fewest requests in flight"""
+        with self._lock:
+            address = min(self.addresses, key=lambda a: self._in_flight[a])
+            self._in_flight[address] += 1
+            conn = self._idle[address].pop() if self._idle[address] else None
+        if conn is not None:
+            return address, conn, True
+        try:
+            return address, Client(address, authkey=INFERENCE_SERVER_AUTHKEY), False
+        except Exception:
+            with self._lock:
+                self._in_flight[address] -= 1
+            raise
+
+    def call(self, command, *args):
+        while True:
+            address, conn, reused = self._acquire()
+            healthy = False
+            try:
+                conn.send((command, args))
+                status, result = conn.recv()
+                healthy = True
+            except (EOFError, OSError):
+                # An idle connection may have outlived a server restart; retry on a fresh one
+                if not reused:
+                    raise
+            finally:
+                with self._lock:
+                    self._in_flight[address] -= 1
+                    if healthy:
+                        self._idle[address].append(conn)
+                if not healthy:
+                    conn.close()
+            if healthy:
+                break
+
+        if status == "error":
+            raise RuntimeError(f"Inference server {address[0]}:{address[1]} failed:\n{result}")
+        return result
+
+    def detect_defects_batch(self, images, **kwargs):
+        import shared_images
+        shm, descriptor = shared_images.pack(images)
+        try:
+            return self.call("detect_defects_batch", descriptor, kwargs)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def broadcast(self, command, *args):
+        """Send a command to every server in turn; returns their results in order"""
+        results = []
+        for address in self.addresses:
+            with Client(address, authkey=INFERENCE_SERVER_AUTHKEY) as conn:
+                conn.send((command, args))
+                status, result = conn.recv()
+            if status == "error":
+                raise RuntimeError(f"Inference server {address[0]}:{address[1]} failed:\n{result}")
+            results.append(result)
+        return results
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+                conns.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analyzer models behind a local socket")
+    parser.add_argument("--address", default=INFERENCE_SERVER_ADDRESS, help="host:port to listen on")
+    parser.add_argument("--no-warmup", action="store_true", help="Load models on first use instead of at start")
+    args = parser.parse_args()
+    serve(args.address, warmup=not args.no_warmup)
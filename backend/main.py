@@ -6,11 +6,13 @@ Backend API with complete verification workflow and admin approval
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 import shutil
 import os
 import json
 import uuid
+import asyncio
 import traceback
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -18,7 +20,13 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from analyzer import detect_defects
+import inference_pool
+import model_registry
+import analysis_jobs
+import result_cache
+import gemini_cache
+from inference_pool import detect_defects_batch_async
+from detections import Detections, expand_stored
 from models import (
     get_db, init_db, PropertySubmission, VerificationTier, VerificationStatus,
     AIAnalysisResult, DiscrepancyReport, PropertyResponse, 
@@ -28,7 +36,8 @@ from models import (
 
 # Import Gemini verifier (optional - works without API key)
 try:
-    from gemini_verifier import analyze_crack_with_gemini, verify_property_images
+    import gemini_verifier
+    from gemini_verifier import verify_property_images_async
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
@@ -48,6 +57,43 @@ app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 # Gemini API key from environment
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
+# Photos per analyzer call when analyzing a property (progress is reported per chunk)
+ANALYSIS_CHUNK_SIZE = int(os.getenv("ANALYZER_BATCH_SIZE", "8"))
+
+# Maximum number of background analysis jobs running at once
+ANALYSIS_JOB_CONCURRENCY = int(os.getenv("ANALYSIS_JOB_CONCURRENCY", "2"))
+
+# Models load lazily on first analysis; set WARMUP_MODELS=1 to load them at startup instead
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "0") == "1"
+
+# With INFERENCE_PRELOAD=1 the models load here, before any worker process is forked
+if inference_pool.INFERENCE_PRELOAD:
+    inference_pool.preload()
+
+
+@app.on_event("startup")
+async def warmup_models():
+    """Optionally load all analyzer models before serving analysis requests"""
+    # Startup runs in every (possibly forked) server worker
+    inference_pool.init_preloaded_process()
+    if WARMUP_MODELS:
+        # Not awaited so /health and non-ML endpoints are served meanwhile
+        asyncio.ensure_future(inference_pool.warmup())
+
+
+@app.on_event("startup")
+async def resume_analysis_jobs():
+    """Restart jobs that were queued or running when the server last stopped"""
+    for job_id, worker_pid in analysis_jobs.list_interrupted_jobs():
+        start_analysis_job(job_id, worker_pid)
+
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    inference_pool.shutdown()
+    if GEMINI_AVAILABLE:
+        gemini_verifier.close()
+
 
 # ==================== Health Check ====================
 
@@ -68,6 +114,53 @@ async def health_check():
         return {"status": "unhealthy", "error": str(e)}
 
 
+@app.get("/models/status")
+async def models_status():
+    """Load state, load time and resident memory for each analyzer model"""
+    return await inference_pool.model_stats()
+
+
+@app.get("/models/memory")
+async def models_memory():
+    """Shared vs private memory of the API process and its inference workers (Linux only)"""
+    return inference_pool.memory_report()
+
+
+@app.get("/models/cache")
+async def result_cache_stats():
+    """Hit/miss counters and size of the analysis result cache"""
+    return result_cache.stats()
+
+
+@app.get("/gemini/stats")
+async def gemini_stats():
+    """Latency, failure and circuit breaker counters of the Gemini client"""
+    if not GEMINI_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Gemini verifier not available")
+    return {**await gemini_verifier.stats_async(), "background_verifications": len(_gemini_tasks)}
+
+
+@app.get("/gemini/cache")
+async def gemini_cache_stats():
+    """Hit/miss counters of the Gemini verdict cache"""
+    return gemini_cache.stats()
+
+
+@app.post("/models/warmup")
+async def models_warmup(models: Optional[str] = None):
+    """
+    Load analyzer models now instead of on first use: those the default analysis uses, or the
+    comma-separated `models` (e.g. "midas,midas_transforms" for depth). `warm_worker_pids`
+    lists the inference workers that loaded them.
+    """
+    names = [name.strip() for name in models.split(",") if name.strip()] if models else None
+    unknown = [name for name in names or [] if name not in model_registry.MODEL_NAMES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models: {', '.join(unknown)}")
+    stats = await inference_pool.warmup(names)
+    return {"success": True, **stats}
+
+
 # ==================== Property Submission ====================
 
 @app.post("/properties/submit")
@@ -225,15 +318,17 @@ async def upload_photos(property_id: int, files: List[UploadFile] = File(...)):
 
 
 @app.post("/properties/{property_id}/analyze")
-async def analyze_property(property_id: int):
+async def analyze_property(
+    property_id: int,
+    background: bool = Query(False, description="Queue the analysis as a job and return its id immediately")
+):
     """Run AI analysis on uploaded property photos"""
     conn = get_db()
     cursor = conn.cursor()
     
     # Get property data
     cursor.execute("""
-        SELECT photos, claimed_area, claimed_width, claimed_length, property_type
-        FROM properties WHERE id = ?
+        SELECT photos, verification_status FROM properties WHERE id = ?
     """, (property_id,))
     row = cursor.fetchone()
     
@@ -246,9 +341,18 @@ async def analyze_property(property_id: int):
         conn.close()
         raise HTTPException(status_code=400, detail="No photos uploaded")
     
-    claimed_area = row["claimed_area"]
-    claimed_width = row["claimed_width"]
-    claimed_length = row["claimed_length"]
+    if background:
+        # Only one job per property at a time - hand back the one in flight
+        active_job = analysis_jobs.get_active_job(property_id)
+        if active_job:
+            conn.close()
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "job_id": active_job["job_id"],
+                "status": active_job["status"],
+                "status_url": f"/analysis-jobs/{active_job['job_id']}"
+            })
+        job_id = analysis_jobs.create_job(property_id, photos, row["verification_status"])
     
     # Update status to analyzing
     cursor.execute(
@@ -260,6 +364,40 @@ async def analyze_property(property_id: int):
         ("ai_analyzing", property_id)
     )
     conn.commit()
+    conn.close()
+    
+    if background:
+        start_analysis_job(job_id)
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "job_id": job_id,
+            "status": analysis_jobs.AnalysisJobStatus.QUEUED.value,
+            "status_url": f"/analysis-jobs/{job_id}"
+        })
+    
+    return await run_property_analysis(property_id)
+
+
+async def run_property_analysis(property_id: int, job_id: str = None):
+    """Analyze every photo of a property and store the results; reports progress when run as a job"""
+    progress = analysis_jobs.JobProgress(job_id) if job_id else None
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT photos, claimed_area, claimed_width, claimed_length, property_type
+        FROM properties WHERE id = ?
+    """, (property_id,))
+    row = cursor.fetchone()
+    if not row:
+        conn.close()
+        raise HTTPException(status_code=404, detail="Property not found")
+    
+    photos = json.loads(row["photos"]) if row["photos"] else []
+    claimed_area = row["claimed_area"]
+    claimed_width = row["claimed_width"]
+    claimed_length = row["claimed_length"]
     
     # Run AI analysis on each photo
     all_spatial = []
@@ -267,24 +405,54 @@ async def analyze_property(property_id: int):
     total_cracks = 0
     room_types = []
     
-    for photo_url in photos:
-        # Convert URL to file path
+    # Convert URLs to file paths
+    photo_paths = []
+    photo_indices = []
+    missing_indices = []
+    for i, photo_url in enumerate(photos):
         photo_path = photo_url.replace("/uploads/", UPLOAD_DIR + "/")
-        
         if os.path.exists(photo_path):
-            detections, spatial, calibrated, img_size = detect_defects(photo_path)
-            
+            photo_paths.append(photo_path)
+            photo_indices.append(i)
+        else:
+            missing_indices.append(i)
+    
+    if progress:
+        progress.start_stage("detection")
+        if missing_indices:
+            progress.set_photos(missing_indices, "missing")
+    
+    # Photos go through the models together, one analyzer batch at a time
+    for start in range(0, len(photo_paths), ANALYSIS_CHUNK_SIZE):
+        chunk_paths = photo_paths[start:start + ANALYSIS_CHUNK_SIZE]
+        chunk_indices = photo_indices[start:start + ANALYSIS_CHUNK_SIZE]
+        if progress:
+            progress.set_photos(chunk_indices, "analyzing")
+        
+        chunk_results = await detect_defects_batch_async(chunk_paths)
+        
+        for (detections, spatial, calibrated, img_size), photo_index in zip(chunk_results, chunk_indices):
             all_spatial.append(spatial)
-            all_detections.extend(detections)
+            all_detections.append(detections.with_photo(photo_index))
             
             # Count cracks
-            crack_count = sum(1 for d in detections if d.get("isCrack", False))
-            total_cracks += crack_count
+            total_cracks += detections.crack_count
             
             room_types.append({
                 "type": spatial.get("room_type", "unknown"),
                 "confidence": spatial.get("room_confidence", 0)
             })
+        
+        if progress:
+            progress.set_photos(chunk_indices, "done", [
+                {"cracks": detections.crack_count,
+                 "room_type": spatial.get("room_type", "unknown"),
+                 "stage_timings_ms": spatial.get("stage_timings_ms", {})}
+                for detections, spatial, _, _ in chunk_results
+            ])
+    
+    if progress:
+        progress.finish_stage("detection")
     
     # Fuse spatial data from multiple images
     if all_spatial:
@@ -331,55 +499,23 @@ async def analyze_property(property_id: int):
                 f"Area discrepancy: Claimed {claimed_area:.1f} sq.m, AI estimated {estimated_area:.1f} sq.m ({area_diff_percent:.1f}% difference)"
             )
     
+    gemini_crack_boxes = None
     if total_cracks > 0:
         has_discrepancy = True
         discrepancy_details.append(
             f"Structural issues detected: {total_cracks} crack(s) found in photos"
         )
         
-        # Trigger Gemini verification if available and cracks are detected
-        if GEMINI_AVAILABLE:
-            try:
-                # Get existing photo paths
-                photo_paths = []
-                for photo_url in photos:
-                    photo_path = photo_url.replace("/uploads/", UPLOAD_DIR + "/")
-                    if os.path.exists(photo_path):
-                        photo_paths.append(photo_path)
-                
-                if photo_paths:
-                    gemini_result = verify_property_images(photo_paths, GEMINI_API_KEY)
-                    
-                    if gemini_result.get("has_real_crack"):
-                         # It confirmed it's a real crack
-                         pass # Keep discrepancy
-                    else:
-                        # Gemini says it's NOT a real crack
-                        # We can potentially lower the severity or flag it for user review with a "good" note
-                        discrepancy_details.append(
-                            f"AI Note: Second-stage analysis suggests these may be decorative/harmless ({gemini_result.get('max_severity')} severity)."
-                        )
-                    
-                    # Store Gemini results
-                    cursor.execute("""
-                        UPDATE properties SET
-                            gemini_crack_verified = 1,
-                            gemini_crack_is_real = ?,
-                            gemini_crack_description = ?,
-                            gemini_crack_severity = ?,
-                            gemini_confidence = ?
-                        WHERE id = ?
-                    """, (
-                        1 if gemini_result.get("has_real_crack") else 0,
-                        gemini_result.get("recommendation", ""),
-                        gemini_result.get("max_severity", "none"),
-                        0.9 if gemini_result.get("has_real_crack") else 0.85,
-                        property_id
-                    ))
-            except Exception as e:
-                print(f"Gemini auto-verification failed: {e}")
+        # Second-stage Gemini verification runs in the background once the results are saved
+        if GEMINI_AVAILABLE and photo_paths:
+            gemini_crack_boxes = [d.boxes[d.is_crack] for d in all_detections]
+    
+    gemini_status = "queued" if gemini_crack_boxes is not None else "skipped"
+    if progress:
+        progress.start_stage("saving")
     
     # Update property with AI results
+    all_detections = Detections.concatenate(all_detections)
     cursor.execute("""
         UPDATE properties SET
             verification_status = ?,
@@ -399,7 +535,7 @@ async def analyze_property(property_id: int):
         1 if total_cracks > 0 else 0,
         1 if has_discrepancy else 0,
         json.dumps(discrepancy_details) if discrepancy_details else None,
-        json.dumps(all_detections) if all_detections else None,
+        json.dumps(all_detections.to_compact()) if len(all_detections) else None,
         property_id
     ))
     
@@ -427,6 +563,13 @@ async def analyze_property(property_id: int):
     conn.commit()
     conn.close()
     
+    if progress:
+        progress.finish_stage("saving")
+        progress.finish_stage("gemini_verification", gemini_status)
+    
+    if gemini_crack_boxes is not None:
+        start_gemini_verification(property_id, photo_paths, gemini_crack_boxes, job_id)
+    
     return {
         "success": True,
         "analysis": {
@@ -442,11 +585,139 @@ async def analyze_property(property_id: int):
             "has_discrepancy": has_discrepancy,
             "details": discrepancy_details
         },
+        # "queued": the gemini_crack_* fields are filled in once the background verification finishes
+        "gemini_verification": gemini_status,
         "needs_confirmation": True,
         "next_step": "confirm_analysis"
     }
 
 
+# ==================== Gemini Verification ====================
+
+_gemini_tasks = set()
+
+
+def start_gemini_verification(property_id: int, photo_paths: list, crack_boxes: list, job_id: str = None):
+    """Verify a property's cracks with Gemini in the background, off the analyze critical path"""
+    task = asyncio.ensure_future(run_gemini_verification(property_id, photo_paths, crack_boxes, job_id))
+    _gemini_tasks.add(task)
+    task.add_done_callback(_gemini_tasks.discard)
+
+
+def store_gemini_result(cursor, property_id: int, result: dict):
+    cursor.execute("""
+        UPDATE properties SET
+            gemini_crack_verified = 1,
+            gemini_crack_is_real = ?,
+            gemini_crack_description = ?,
+            gemini_crack_severity = ?,
+            gemini_confidence = ?
+        WHERE id = ?
+    """, (
+        1 if result.get("has_real_crack") else 0,
+        result.get("recommendation", ""),
+        result.get("max_severity", "none"),
+        0.9 if result.get("has_real_crack") else 0.85,
+        property_id
+    ))
+
+
+async def run_gemini_verification(property_id: int, photo_paths: list, crack_boxes: list, job_id: str = None):
+    """Run the second-stage verification and store it on the property when it succeeds"""
+    progress = analysis_jobs.JobProgress(job_id) if job_id else None
+    if progress:
+        progress.start_stage("gemini_verification")
+    try:
+        gemini_result = await verify_property_images_async(photo_paths, GEMINI_API_KEY, crack_boxes=crack_boxes)
+        # Without a single verdict (Gemini down, circuit open) the cracks stay unverified
+        if not any(r["analysis"]["success"] for r in gemini_result["detailed_results"]):
+            errors = {r["analysis"].get("error") for r in gemini_result["detailed_results"]}
+            raise RuntimeError("; ".join(sorted(str(e) for e in errors)) or "no photos sent")
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        if not gemini_result.get("has_real_crack"):
+            # Gemini says it's NOT a real crack - add a "good" note for the reviewer
+            row = cursor.execute(
+                "SELECT ai_discrepancy_details FROM properties WHERE id = ?", (property_id,)
+            ).fetchone()
+            details = json.loads(row["ai_discrepancy_details"]) if row and row["ai_discrepancy_details"] else []
+            details.append(
+                f"AI Note: Second-stage analysis suggests these may be decorative/harmless ({gemini_result.get('max_severity')} severity)."
+            )
+            cursor.execute(
+                "UPDATE properties SET ai_discrepancy_details = ? WHERE id = ?", (json.dumps(details), property_id)
+            )
+        store_gemini_result(cursor, property_id, gemini_result)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Gemini auto-verification of property {property_id} failed: {e}")
+        if progress:
+            progress.finish_stage("gemini_verification", "failed")
+        return
+    if progress:
+        progress.finish_stage("gemini_verification")
+
+
+# ==================== Analysis Jobs ====================
+
+_analysis_job_slots = asyncio.Semaphore(ANALYSIS_JOB_CONCURRENCY)
+_analysis_job_tasks = set()
+
+
+def start_analysis_job(job_id: str, previous_pid: int = None):
+    """Schedule a queued (or interrupted, see analysis_jobs.list_interrupted_jobs) job on the event loop"""
+    task = asyncio.ensure_future(execute_analysis_job(job_id, previous_pid))
+    # Keep a reference so the task is not garbage collected mid-run
+    _analysis_job_tasks.add(task)
+    task.add_done_callback(_analysis_job_tasks.discard)
+
+
+async def execute_analysis_job(job_id: str, previous_pid: int = None):
+    """Run a job and drive the property's verification status from its outcome"""
+    async with _analysis_job_slots:
+        job = analysis_jobs.get_job(job_id)
+        # Another server worker may have claimed it first
+        if not job or not analysis_jobs.claim_job(job_id, previous_pid):
+            return
+        
+        try:
+            result = await run_property_analysis(job["property_id"], job_id=job_id)
+            analysis_jobs.mark_completed(job_id, result)
+        except Exception as e:
+            traceback.print_exc()
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            analysis_jobs.mark_failed(job_id, error)
+            
+            # Roll the property back out of 'ai_analyzing' so it can be analyzed again
+            previous_status = job["previous_status"] or "pending"
+            conn = get_db()
+            conn.execute(
+                "UPDATE properties SET verification_status = ? WHERE id = ? AND verification_status = ?",
+                (previous_status, job["property_id"], "ai_analyzing")
+            )
+            conn.execute(
+                "UPDATE verification_requests SET status = ? WHERE property_id = ? AND status = ?",
+                (previous_status, job["property_id"], "ai_analyzing")
+            )
+            conn.commit()
+            conn.close()
+            log_property_activity(
+                job["property_id"], "analysis_failed", f"AI analysis job failed: {error}",
+                metadata={"job_id": job_id}
+            )
+
+
+@app.get("/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Progress per photo and per stage, and the final result once the job completes"""
+    job = analysis_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job
+
+
 @app.post("/properties/{property_id}/confirm-analysis")
 async def confirm_analysis(
     property_id: int,
@@ -807,7 +1078,7 @@ async def get_verification_status(property_id: int):
             "crack_detected": bool(row["ai_crack_detected"]),
             "discrepancy_flag": bool(row["ai_discrepancy_flag"]),
             "discrepancy_details": json.loads(row["ai_discrepancy_details"]) if row["ai_discrepancy_details"] else [],
-            "detections": json.loads(row["ai_detections"]) if "ai_detections" in row.keys() and row["ai_detections"] else []
+            "detections": expand_stored(json.loads(row["ai_detections"])) if "ai_detections" in row.keys() and row["ai_detections"] else []
         }
     }
 
@@ -937,28 +1208,23 @@ async def reconstruct_room(files: List[UploadFile] = File(...)):
     calibration_status = False
     room_types = []
     
-    for file in files:
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    # Uploads are decoded straight from memory; nothing touches the filesystem
+    uploads = [await file.read() for file in files]
+    batch_results = await detect_defects_batch_async(uploads)
+    
+    for detections, spatial, calibrated, img_size in batch_results:
+        per_image_results.append({
+            "detections": detections.to_dicts(),
+            "img_size": img_size
+        })
+        all_spatial.append(spatial)
+        if calibrated: 
+            calibration_status = True
         
-        try:
-            detections, spatial, calibrated, img_size = detect_defects(temp_path)
-            per_image_results.append({
-                "detections": detections,
-                "img_size": img_size
-            })
-            all_spatial.append(spatial)
-            if calibrated: 
-                calibration_status = True
-            
-            room_types.append({
-                "type": spatial.get("room_type", "unknown"),
-                "confidence": spatial.get("room_confidence", 0)
-            })
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        room_types.append({
+            "type": spatial.get("room_type", "unknown"),
+            "confidence": spatial.get("room_confidence", 0)
+        })
 
     # Fuse spatial data
     fused_spatial = {
@@ -1264,7 +1530,7 @@ async def verify_cracks_with_gemini(property_id: int, api_key: Optional[str] = F
     cursor = conn.cursor()
     
     # Get property photos
-    cursor.execute("SELECT photos, ai_crack_detected FROM properties WHERE id = ?", (property_id,))
+    cursor.execute("SELECT photos, ai_crack_detected, ai_detections FROM properties WHERE id = ?", (property_id,))
     row = cursor.fetchone()
     
     if not row:
@@ -1278,34 +1544,31 @@ async def verify_cracks_with_gemini(property_id: int, api_key: Optional[str] = F
     
     # Convert photo URLs to file paths
     photo_paths = []
-    for photo_url in photos:
+    photo_indices = []
+    for i, photo_url in enumerate(photos):
         photo_path = photo_url.replace("/uploads/", UPLOAD_DIR + "/")
         if os.path.exists(photo_path):
             photo_paths.append(photo_path)
+            photo_indices.append(i)
     
     if not photo_paths:
         conn.close()
         raise HTTPException(status_code=400, detail="No valid photo files found")
     
+    # Once analyzed, only the crack regions of photos with crack boxes are sent
+    crack_boxes = None
+    stored = expand_stored(json.loads(row["ai_detections"])) if row["ai_detections"] else []
+    # Rows saved before boxes recorded their photo cannot be matched to photos: send those in full
+    if stored and all("photo" in item for item in stored):
+        detections = Detections.from_dicts(stored)
+        detections = detections[detections.is_crack]
+        crack_boxes = [detections.boxes[detections.photo == i] for i in photo_indices]
+    
     # Run Gemini analysis
-    result = verify_property_images(photo_paths, key)
+    result = await verify_property_images_async(photo_paths, key, crack_boxes=crack_boxes)
     
     # Update property with Gemini results
-    cursor.execute("""
-        UPDATE properties SET
-            gemini_crack_verified = 1,
-            gemini_crack_is_real = ?,
-            gemini_crack_description = ?,
-            gemini_crack_severity = ?,
-            gemini_confidence = ?
-        WHERE id = ?
-    """, (
-        1 if result["has_real_crack"] else 0,
-        result.get("recommendation", ""),
-        result.get("max_severity", "none"),
-        0.9 if result["has_real_crack"] else 0.85,
-        property_id
-    ))
+    store_gemini_result(cursor, property_id, result)
     
     conn.commit()
     conn.close()
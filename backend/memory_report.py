@@ -0,0 +1,82 @@
+"""
+VisionEstate - Memory Report
+Shared vs private memory per process from /proc/<pid>/smaps_rollup (Linux), to check how
+much of the model memory forked workers actually share (INFERENCE_PRELOAD).
+
+    python memory_report.py <pid>      # a process and all its descendants, e.g. the gunicorn master
+"""
+
+import os
+import sys
+import json
+
+_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid="self"):
+    """Resident, proportional, shared and private memory of one process in MB; None if unavailable"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _FIELDS:
+                    values[key] = int(rest.split()[0]) / 1024  # kB -> MB
+    except (OSError, ValueError, IndexError):
+        return None
+    if not values:
+        return None
+
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_mb": round(values.get("Rss", 0.0), 1),
+        # Proportional set size: private pages plus this process's share of shared ones
+        "pss_mb": round(values.get("Pss", 0.0), 1),
+        "shared_mb": round(values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0), 1),
+        "private_mb": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def descendants(pid):
+    """Pids of every process below `pid`"""
+    found = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return found
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children = [int(child) for child in f.read().split()]
+        except (OSError, ValueError):
+            continue
+        for child in children:
+            found.append(child)
+            found.extend(descendants(child))
+    return found
+
+
+def memory_report(pids) -> dict:
+    """Per-process memory plus totals; the PSS total is what the processes really cost together"""
+    processes = [m for m in (process_memory(pid) for pid in pids) if m is not None]
+    return {
+        "processes": processes,
+        "total_rss_mb": round(sum(p["rss_mb"] for p in processes), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "total_private_mb": round(sum(p["private_mb"] for p in processes), 1),
+    }
+
+
+def process_tree_report(pid="self") -> dict:
+    """Memory report for a process and all its descendants"""
+    root = os.getpid() if pid == "self" else int(pid)
+    return memory_report([root] + descendants(root))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python memory_report.py <pid>")
+    report = process_tree_report(sys.argv[1])
+    if not report["processes"]:
+        sys.exit(f"No memory information for process {sys.argv[1]} (Linux /proc only)")
+    print(json.dumps(report, indent=2))
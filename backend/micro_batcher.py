@@ -0,0 +1,191 @@
+"""
+VisionEstate - Micro-Batching
+Coalesces the forward passes of concurrent analyses into one batched call per model.
+
+Each model gets a MicroBatcher with a collector thread. Callers submit an input tensor and
+block; the collector gathers pending inputs for up to max_wait_ms or max_batch_size rows,
+runs one forward pass on the concatenation and hands every caller its slice of the output.
+Only analyses running concurrently in the same process can share a batch (INFERENCE_THREADS).
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+import numpy as np
+
+# Route analyzer forward passes through the per-model batchers (0/1)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH", "0") == "1"
+
+# Defaults for every model; MICROBATCH_MAX_SIZE_<MODEL> / MICROBATCH_MAX_WAIT_MS_<MODEL> override them
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "16"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+
+# Number of recent batches the metrics are computed over
+METRICS_WINDOW = 1024
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+# Analyses currently running in this process; once all of them are waiting, nothing else can join a batch
+_active_analyses = 0
+_active_lock = threading.Lock()
+
+
+def _setting(name: str, key: str, default: str) -> str:
+    return os.getenv(f"MICROBATCH_{key}_{name.upper()}") or default
+
+
+class _Request:
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """Batches fn(tensor) calls from concurrent threads along the first dimension"""
+
+    def __init__(self, name, fn, max_batch_size=None, max_wait_ms=None):
+        self.name = name
+        self.fn = fn
+        self.max_batch_size = max_batch_size or int(_setting(name, "MAX_SIZE", str(MICROBATCH_MAX_SIZE)))
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(
+            _setting(name, "MAX_WAIT_MS", str(MICROBATCH_MAX_WAIT_MS))
+        )
+
+        self._queue = queue.Queue()
+        self._carry = None  # request that did not fit into the previous batch
+        self._batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self._queue_waits_ms = deque(maxlen=METRICS_WINDOW)
+        self._batches = 0
+        self._requests = 0
+
+        self._thread = threading.Thread(target=self._collect, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, tensor):
+        """Run fn on `tensor` as part of a shared batch; blocks until the caller's rows are done"""
+        request = _Request(tensor)
+        self._queue.put(request)
+        return request.future.result()
+
+    # ==================== Collector Thread ====================
+
+    def _next_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait is over"""
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch, rows = [first], len(first.tensor)
+        deadline = first.enqueued + self.max_wait_ms / 1000
+
+        while rows < self.max_batch_size and len(batch) < active_analyses():
+            # Past the deadline, still take whatever queued up during the previous forward pass
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if rows + len(request.tensor) > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            rows += len(request.tensor)
+        return batch
+
+    def _collect(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+
+            # Only inputs with the same per-row shape can be stacked
+            groups = {}
+            for request in batch:
+                groups.setdefault((tuple(request.tensor.shape[1:]), request.tensor.dtype), []).append(request)
+
+            for group in groups.values():
+                self._run(group, started)
+
+    def _run(self, group, started):
+        import torch
+
+        try:
+            tensor = group[0].tensor if len(group) == 1 else torch.cat([r.tensor for r in group])
+            output = self.fn(tensor)
+            parts = output.split([len(r.tensor) for r in group])
+        except Exception as e:
+            for request in group:
+                request.future.set_exception(e)
+        else:
+            for request, part in zip(group, parts):
+                request.future.set_result(part)
+
+        self._batches += 1
+        self._requests += len(group)
+        self._batch_sizes.append(sum(len(r.tensor) for r in group))
+        self._queue_waits_ms.extend((started - r.enqueued) * 1000 for r in group)
+
+    def stats(self) -> dict:
+        sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+        waits = np.asarray(self._queue_waits_ms, dtype=np.float64)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self._batches,
+            "requests": self._requests,
+            "queued": self._queue.qsize() + (self._carry is not None),
+            "batch_size_mean": round(float(sizes.mean()), 2) if len(sizes) else None,
+            "batch_size_max": int(sizes.max()) if len(sizes) else None,
+            "queue_wait_ms_p50": round(float(np.percentile(waits, 50)), 2) if len(waits) else None,
+            "queue_wait_ms_p95": round(float(np.percentile(waits, 95)), 2) if len(waits) else None,
+        }
+
+
+# ==================== Module API ====================
+
+@contextmanager
+def analysis():
+    """Mark one analysis as running, so batchers know how many callers to wait for"""
+    global _active_analyses
+    with _active_lock:
+        _active_analyses += 1
+    try:
+        yield
+    finally:
+        with _active_lock:
+            _active_analyses -= 1
+
+
+def active_analyses() -> int:
+    return max(_active_analyses, 1)
+
+
+def get(name, fn):
+    """The batcher for a model, created with `fn` as its forward pass on first use"""
+    batcher = _batchers.get(name)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(name)
+            if batcher is None:
+                batcher = _batchers[name] = MicroBatcher(name, fn)
+    return batcher
+
+
+def forward(name, fn, tensor):
+    """fn(tensor), through the model's batcher when micro-batching is enabled"""
+    if not MICROBATCH_ENABLED:
+        return fn(tensor)
+    return get(name, fn).submit(tensor)
+
+
+def stats() -> dict:
+    """Batch size and queue wait metrics per model"""
+    return {
+        "enabled": MICROBATCH_ENABLED,
+        "active_analyses": _active_analyses,
+        "models": {name: batcher.stats() for name, batcher in _batchers.items()},
+    }
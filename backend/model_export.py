@@ -0,0 +1,200 @@
+"""
+VisionEstate - Model Export
+Shared by the ONNX and TorchScript backends: the wrappers that turn each analyzer model into
+plain tensor-in / tensor-out graphs with example inputs, CLIP's metadata file, the runtime
+wrappers' common interface and the `export` command line. Each backend only supplies how a
+graph is saved and how a saved graph is run.
+"""
+
+import os
+import json
+import shutil
+import argparse
+from types import SimpleNamespace
+
+# Registry models that can be exported
+EXPORT_MODELS = ["segformer", "clip", "midas", "yolo_objects", "yolo_cracks"]
+YOLO_MODELS = ("yolo_objects", "yolo_cracks")
+
+CLIP_META_FILE = "clip.json"
+
+
+class ExportGraph:
+    """
+    One graph to save: `module` called on the `args` example inputs. `inputs`/`outputs` name
+    its tensors and `dynamic_axes` the dimensions that vary between calls, for formats that
+    record them.
+    """
+
+    def __init__(self, name, module, args, inputs, outputs, dynamic_axes):
+        self.name = name
+        self.module = module
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.dynamic_axes = dynamic_axes
+
+
+# ==================== Runtime Wrappers ====================
+#
+# Each wrapper exposes the slice of the PyTorch model's interface the analyzer calls, so
+# stages do not care which backend they got from the registry. Backends implement the
+# underscored methods.
+
+class ExportedSegformer:
+    backend = None
+
+    def eval(self):
+        return self
+
+    def __call__(self, pixel_values):
+        return SimpleNamespace(logits=self._logits(pixel_values))
+
+
+class ExportedClip:
+    backend = None
+
+    def __init__(self, meta_path):
+        import torch
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.logit_scale = torch.tensor(meta["logit_scale"])
+        self.config = SimpleNamespace(_commit_hash=meta.get("revision"))
+
+    def eval(self):
+        return self
+
+    def get_image_features(self, pixel_values):
+        return self._image_embeds(pixel_values)
+
+    def get_text_features(self, input_ids, attention_mask=None, **_):
+        import torch
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return self._text_embeds(input_ids.long(), attention_mask.long())
+
+
+def clip_paths(directory, graph_path):
+    """Files an exported CLIP consists of: vision graph, text graph and metadata"""
+    return [graph_path("clip_vision"), graph_path("clip_text"), os.path.join(directory, CLIP_META_FILE)]
+
+
+# ==================== Export ====================
+
+def _segformer_graphs():
+    import torch
+    import model_registry
+    model = model_registry.get("segformer")
+
+    class Logits(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).logits
+
+    return [ExportGraph("segformer", Logits(), (torch.zeros(1, 3, 512, 512),),
+                        ["pixel_values"], ["logits"], {"pixel_values": {0: "batch"}, "logits": {0: "batch"}})]
+
+
+def _clip_graphs():
+    import torch
+    import model_registry
+    model = model_registry.get("clip")
+    processor = model_registry.get("clip_processor")
+
+    class ImageEmbeds(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    class TextEmbeds(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    crop = processor.image_processor.crop_size
+    text = processor(text=["a photo of a room"], return_tensors="pt", padding=True)
+    return [
+        ExportGraph("clip_vision", ImageEmbeds(), (torch.zeros(1, 3, crop["height"], crop["width"]),),
+                    ["pixel_values"], ["image_embeds"], {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}}),
+        ExportGraph("clip_text", TextEmbeds(), (text["input_ids"], text["attention_mask"]),
+                    ["input_ids", "attention_mask"], ["text_embeds"],
+                    {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                     "text_embeds": {0: "batch"}}),
+    ]
+
+
+def _midas_graphs():
+    import torch
+    import model_registry
+    midas = model_registry.get("midas").cpu()
+    return [ExportGraph("midas", midas, (torch.zeros(1, 3, 256, 256),), ["image"], ["depth"],
+                        {"image": {0: "batch", 2: "height", 3: "width"}, "depth": {0: "batch", 1: "height", 2: "width"}})]
+
+
+GRAPHS = {
+    "segformer": _segformer_graphs,
+    "clip": _clip_graphs,
+    "midas": _midas_graphs,
+}
+
+
+def write_clip_meta(directory):
+    import model_registry
+    model = model_registry.get("clip")
+    with open(os.path.join(directory, CLIP_META_FILE), "w") as f:
+        json.dump({
+            "logit_scale": model.logit_scale.item(),
+            "revision": getattr(model.config, "_commit_hash", None) or model_registry.CLIP_CHECKPOINT,
+        }, f)
+
+
+def export_yolo(name, path, **options):
+    """Let Ultralytics export a detector, then move the file it wrote to `path`"""
+    import model_registry
+    model = model_registry.get(name)
+    exported = model.export(imgsz=640, **options)
+    shutil.move(exported, path)
+
+
+def export_models(directory, save_graph, save_yolo, names=None):
+    """
+    Export models (default: all) into directory. save_graph(graph) writes one ExportGraph and
+    save_yolo(name) one detector in the backend's format.
+    """
+    import model_registry
+    os.makedirs(directory, exist_ok=True)
+    for name in names or EXPORT_MODELS:
+        # Always export the full-precision PyTorch modules, whatever backend or precision is selected
+        os.environ[f"ANALYZER_BACKEND_{name.upper()}"] = "torch"
+        os.environ[f"ANALYZER_PRECISION_{name.upper()}"] = "fp32"
+        print(f"Exporting {name}...")
+        if name in YOLO_MODELS:
+            save_yolo(name)
+        else:
+            for graph in GRAPHS[name]():
+                save_graph(graph)
+        if name == "clip":
+            write_clip_meta(directory)
+        model_registry.unload(name)
+
+
+def main(description, directory, save_graph, save_yolo):
+    """`export [--models ...]` command line of a backend"""
+    parser = argparse.ArgumentParser(description=description)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help=f"Export models to {directory}")
+    export_parser.add_argument("--models", nargs="+", choices=EXPORT_MODELS, help="Models to export (default: all)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_models(directory, save_graph, save_yolo, args.models)
+        print(f"Models written to {directory}")
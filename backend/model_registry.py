@@ -0,0 +1,269 @@
+"""
+VisionEstate - Shared Model Registry
+Loads the analyzer models lazily on first use and shares one instance per process.
+"""
+
+import gc
+import os
+import time
+import threading
+import contextlib
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SEGFORMER_CHECKPOINT = "nvidia/segformer-b0-finetuned-ade-512-512"
+CLIP_CHECKPOINT = "openai/clip-vit-base-patch16"
+MIDAS_MODEL_TYPE = "MiDaS_small"
+OBJECT_MODEL_PATH = os.getenv("OBJECT_MODEL_PATH", "yolov8n.pt")
+CRACK_MODEL_PATH = os.getenv("CRACK_MODEL_PATH", os.path.join(SCRIPT_DIR, "crack.pt"))
+
+# Inference backend: "torch" (default), "onnx" or "torchscript"; ANALYZER_BACKEND_<MODEL> overrides it per model
+ANALYZER_BACKEND = os.getenv("ANALYZER_BACKEND", "torch").lower()
+
+# Numeric precision: "fp32" (default), "bf16" (CPU autocast) or "int8" (dynamic quantization of
+# Linear layers); ANALYZER_PRECISION_<MODEL> overrides it per model
+ANALYZER_PRECISION = os.getenv("ANALYZER_PRECISION", "fp32").lower()
+
+# Precision modes each model supports; everything else always runs in fp32
+PRECISION_MODES = {
+    "segformer": ("fp32", "bf16", "int8"),
+    "clip": ("fp32", "bf16", "int8"),
+    "midas": ("fp32", "bf16"),
+}
+
+_loaders = {}
+_models = {}
+_stats = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str):
+    """Register a loader function under a model name"""
+    def decorator(fn):
+        _loaders[name] = fn
+        _locks[name] = threading.Lock()
+        return fn
+    return decorator
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux - best effort off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_device():
+    """Torch device used by MiDaS (SegFormer and CLIP always stay on CPU)"""
+    import torch
+    return torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
+
+# ==================== Loaders ====================
+
+@register("segformer_processor")
+def _load_segformer_processor():
+    from transformers import SegformerFeatureExtractor
+    return SegformerFeatureExtractor.from_pretrained(SEGFORMER_CHECKPOINT)
+
+
+@register("segformer")
+def _load_segformer():
+    from transformers import SegformerForSemanticSegmentation
+    return SegformerForSemanticSegmentation.from_pretrained(SEGFORMER_CHECKPOINT).eval()
+
+
+@register("clip_processor")
+def _load_clip_processor():
+    from transformers import CLIPProcessor
+    return CLIPProcessor.from_pretrained(CLIP_CHECKPOINT)
+
+
+@register("clip")
+def _load_clip():
+    from transformers import CLIPModel
+    return CLIPModel.from_pretrained(CLIP_CHECKPOINT).eval()
+
+
+@register("yolo_objects")
+def _load_yolo_objects():
+    from ultralytics import YOLO
+    return YOLO(OBJECT_MODEL_PATH)
+
+
+@register("yolo_cracks")
+def _load_yolo_cracks():
+    from ultralytics import YOLO
+    return YOLO(CRACK_MODEL_PATH)
+
+
+@register("midas")
+def _load_midas():
+    import torch
+    return torch.hub.load("intel-isl/MiDaS", MIDAS_MODEL_TYPE, trust_repo=True).to(get_device()).eval()
+
+
+@register("midas_transforms")
+def _load_midas_transforms():
+    import torch
+    return torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
+
+
+MODEL_NAMES = list(_loaders)
+
+
+def backend_for(name: str) -> str:
+    """Backend requested for a model (read at load time so it can be set per process)"""
+    return os.getenv(f"ANALYZER_BACKEND_{name.upper()}", ANALYZER_BACKEND).lower()
+
+
+def _requested_precision(name: str) -> str:
+    return os.getenv(f"ANALYZER_PRECISION_{name.upper()}", ANALYZER_PRECISION).lower()
+
+
+def precision_for(name: str) -> str:
+    """Precision a model runs in: the requested mode, or fp32 when the model does not support it"""
+    precision = _requested_precision(name)
+    return precision if precision in PRECISION_MODES.get(name, ("fp32",)) else "fp32"
+
+
+def _quantize_int8(model):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load(name: str):
+    """Run the loader for the requested backend and precision; returns (model, backend, precision)"""
+    if backend_for(name) == "onnx":
+        import onnx_backend
+        if name in onnx_backend.ONNX_MODELS:
+            model = onnx_backend.load(name)
+            if model is not None:
+                # Exported graphs are fp32; precision modes only apply to torch models
+                return model, "onnx", "fp32"
+            print(f"No ONNX export for model '{name}' in {onnx_backend.ONNX_MODEL_DIR}, using torch")
+    elif backend_for(name) == "torchscript":
+        import torchscript_backend
+        if name in torchscript_backend.TORCHSCRIPT_MODELS:
+            model = torchscript_backend.load(name)
+            if model is not None:
+                # Archives are traced and frozen in fp32
+                return model, "torchscript", "fp32"
+            print(f"No TorchScript export for model '{name}' in {torchscript_backend.TORCHSCRIPT_MODEL_DIR}, using torch")
+
+    import model_store
+    model = model_store.load(name) if model_store.use_store(name) else _loaders[name]()
+    precision = precision_for(name)
+    if f"ANALYZER_PRECISION_{name.upper()}" in os.environ and precision != _requested_precision(name):
+        print(f"Precision '{_requested_precision(name)}' is not supported for model '{name}', using fp32")
+    if precision == "int8":
+        model = _quantize_int8(model)
+    return model, "torch", precision
+
+
+# ==================== Public API ====================
+
+def get(name: str):
+    """Return the shared instance of a model, loading it on first use"""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    if name not in _loaders:
+        raise KeyError(f"Unknown model '{name}'. Available: {', '.join(MODEL_NAMES)}")
+
+    with _locks[name]:
+        # Another thread may have finished loading while we waited
+        if name in _models:
+            return _models[name]
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model, backend, precision = _load(name)
+        load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        with _registry_lock:
+            _models[name] = model
+            _stats[name] = {
+                "backend": backend,
+                "precision": precision,
+                "load_seconds": round(load_seconds, 3),
+                "rss_delta_mb": round(max(rss_after - rss_before, 0) / (1024 * 1024), 1),
+                "loaded_at": time.time(),
+            }
+        print(f"Loaded model '{name}' ({backend}, {precision}) in {load_seconds:.2f}s "
+              f"(+{_stats[name]['rss_delta_mb']} MB RSS)")
+        return model
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def loaded_precision(name: str) -> str:
+    """Precision the loaded instance of a model runs in"""
+    return _stats.get(name, {}).get("precision", "fp32")
+
+
+def autocast(name: str, device_type: str = "cpu"):
+    """Context for running a loaded model: bfloat16 autocast in bf16 mode, a no-op otherwise"""
+    if loaded_precision(name) != "bf16":
+        return contextlib.nullcontext()
+    import torch
+    return torch.autocast(device_type, dtype=torch.bfloat16)
+
+
+def numeric_config() -> dict:
+    """Backend and precision each model would load with; results depend on both"""
+    return {name: [backend_for(name), precision_for(name)] for name in MODEL_NAMES}
+
+
+def unload(name: str):
+    """Drop the shared instance so the next get() loads it again"""
+    with _registry_lock:
+        _models.pop(name, None)
+        _stats.pop(name, None)
+
+
+def warmup(names: list = None) -> dict:
+    """
+    Load the given models ahead of the first request. By default only those the default
+    analysis uses (analyzer.default_models); MiDaS then still loads on the first depth request.
+    """
+    if not names:
+        import analyzer
+        names = analyzer.default_models()
+    for name in names:
+        get(name)
+    return model_stats()
+
+
+def preload(names: list = None) -> dict:
+    """
+    Load models in a parent process before it forks workers, so they share the weights
+    copy-on-write. gc.freeze() moves every object allocated so far out of the collector's
+    reach, which keeps collections in the children from writing to (and copying) those pages.
+    """
+    stats = warmup(names)
+    gc.collect()
+    gc.freeze()
+    return stats
+
+
+def model_stats() -> dict:
+    """Load time and resident memory attributed to each model"""
+    with _registry_lock:
+        models = {
+            name: {"loaded": name in _models, **_stats.get(name, {})}
+            for name in MODEL_NAMES
+        }
+    return {
+        "process_rss_mb": round(_rss_bytes() / (1024 * 1024), 1),
+        "models": models,
+    }
@@ -0,0 +1,371 @@
+"""
+VisionEstate - Local Model Store
+Vendors every analyzer model into a versioned directory of safetensors weights, so models
+load offline and without unpickling checkpoints. Weights are memory-mapped: loading does not
+copy them, and processes on one machine share the pages through the OS page cache.
+
+    python model_store.py vendor                 # fetch everything into MODEL_STORE_DIR/<MODEL_STORE_VERSION>
+    python model_store.py vendor --version 2     # vendor into a new version side by side
+    python model_store.py verify                 # check file hashes against the manifest
+
+ANALYZER_MODEL_SOURCE picks where the registry loads from: "auto" (the store when a model is
+vendored, upstream otherwise), "store" (never touch the network) or "upstream".
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import struct
+import hashlib
+import argparse
+import contextlib
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR") or os.path.join(SCRIPT_DIR, "model_store")
+MODEL_STORE_VERSION = os.getenv("MODEL_STORE_VERSION", "1")
+
+WEIGHTS_FILE = "model.safetensors"
+MANIFEST_FILE = "manifest.json"
+
+# Torch hub repos and checkpoints MiDaS builds itself from (its hubconf loads the EfficientNet backbone)
+_HUB_PREFIXES = ("intel-isl_MiDaS_", "rwightman_gen-efficientnet-pytorch_")
+_HUB_CHECKPOINT_HINT = "efficientnet"
+
+_manifests = {}
+
+
+def store_path(*parts, version=None) -> str:
+    return os.path.join(MODEL_STORE_DIR, version or MODEL_STORE_VERSION, *parts)
+
+
+def manifest(version=None):
+    """The manifest of a vendored store version, or None when it does not exist"""
+    version = version or MODEL_STORE_VERSION
+    if version not in _manifests:
+        path = store_path(MANIFEST_FILE, version=version)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            _manifests[version] = json.load(f)
+    return _manifests[version]
+
+
+def model_source() -> str:
+    """Read at load time, so it can be set per process"""
+    return os.getenv("ANALYZER_MODEL_SOURCE", "auto").lower()
+
+
+def use_store(name: str) -> bool:
+    """Whether the registry should load `name` from the store"""
+    source = model_source()
+    if source == "upstream":
+        return False
+    vendored = name in ((manifest() or {}).get("models") or {})
+    if source == "store" and not vendored:
+        raise RuntimeError(
+            f"Model '{name}' is not in the model store at {store_path()}; "
+            f"run: python model_store.py vendor"
+        )
+    return vendored
+
+
+# ==================== Safetensors ====================
+
+_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def save_tensors(module, path) -> dict:
+    """
+    Write every parameter and buffer of `module` (non-persistent buffers included) to a
+    safetensors file. Returns {alias: name} for tensors that share storage with another one.
+    """
+    from safetensors.torch import save_file
+
+    tensors = {}
+    aliases = {}
+    seen = {}
+    named = list(module.named_parameters(remove_duplicate=False)) + list(module.named_buffers(remove_duplicate=False))
+    for name, tensor in named:
+        if tensor is None:
+            continue
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape))
+        if tensor.numel() and key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        tensors[name] = tensor.detach().to("cpu", copy=True).contiguous()
+    save_file(tensors, path)
+    return aliases
+
+
+def load_tensors(path) -> dict:
+    """
+    Tensors of a safetensors file as views of a memory map of it. The private (copy-on-write)
+    mapping keeps them writable without ever writing to the file.
+    """
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    base = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, _DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty(0, dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count, offset=base + start).reshape(info["shape"])
+    return tensors
+
+
+def assign_tensors(module, tensors, aliases=None):
+    """Make the module's parameters and buffers the given (memory-mapped) tensors, without copying"""
+    import torch
+
+    for name, tensor in list(tensors.items()) + [(alias, tensors[target]) for alias, target in (aliases or {}).items()]:
+        owner_name, _, attr = name.rpartition(".")
+        owner = module.get_submodule(owner_name)
+        if attr in owner._parameters:
+            owner._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attr in owner._buffers:
+            owner._buffers[attr] = tensor
+        else:
+            raise KeyError(f"'{name}' is neither a parameter nor a buffer of {type(module).__name__}")
+
+    missing = [name for name, t in list(module.named_parameters()) + list(module.named_buffers()) if t.is_meta]
+    if missing:
+        raise RuntimeError(f"Model store weights are missing {len(missing)} tensors, e.g. {missing[:3]}")
+    return module
+
+
+def _load_weights(name, module):
+    entry = manifest()["models"][name]
+    return assign_tensors(module, load_tensors(store_path(name, WEIGHTS_FILE)), entry.get("aliases"))
+
+
+# ==================== Store Loaders ====================
+
+@contextlib.contextmanager
+def _hub_dir():
+    """Point torch hub at the vendored repos and checkpoints while MiDaS builds itself"""
+    import torch
+    previous = torch.hub.get_dir()
+    torch.hub.set_dir(store_path("hub"))
+    try:
+        yield
+    finally:
+        torch.hub.set_dir(previous)
+
+
+def _midas_repo() -> str:
+    hub = store_path("hub")
+    return os.path.join(hub, next(entry for entry in os.listdir(hub) if entry.startswith(_HUB_PREFIXES[0])))
+
+
+def _load_transformers_model(name, model_class):
+    import torch
+    config = model_class.config_class.from_pretrained(store_path(name))
+    # Build without allocating weights; they are mapped from the store instead
+    with torch.device("meta"):
+        model = model_class(config)
+    return _load_weights(name, model).eval()
+
+
+def _load_segformer_processor():
+    from transformers import SegformerFeatureExtractor
+    return SegformerFeatureExtractor.from_pretrained(store_path("segformer_processor"))
+
+
+def _load_segformer():
+    from transformers import SegformerForSemanticSegmentation
+    return _load_transformers_model("segformer", SegformerForSemanticSegmentation)
+
+
+def _load_clip_processor():
+    from transformers import CLIPProcessor
+    return CLIPProcessor.from_pretrained(store_path("clip_processor"))
+
+
+def _load_clip():
+    from transformers import CLIPModel
+    return _load_transformers_model("clip", CLIPModel)
+
+
+def _load_midas():
+    import torch
+    import model_registry
+    with _hub_dir():
+        model = torch.hub.load(_midas_repo(), model_registry.MIDAS_MODEL_TYPE, source="local", pretrained=False)
+    return _load_weights("midas", model).to(model_registry.get_device()).eval()
+
+
+def _load_midas_transforms():
+    import torch
+    with _hub_dir():
+        return torch.hub.load(_midas_repo(), "transforms", source="local")
+
+
+def _load_yolo(name):
+    from ultralytics import YOLO
+    yolo = YOLO(store_path(name, "model.yaml"), task="detect")
+    _load_weights(name, yolo.model)
+    yolo.model.names = {int(k): v for k, v in manifest()["models"][name]["names"].items()}
+    return yolo
+
+
+LOADERS = {
+    "segformer_processor": _load_segformer_processor,
+    "segformer": _load_segformer,
+    "clip_processor": _load_clip_processor,
+    "clip": _load_clip,
+    "midas": _load_midas,
+    "midas_transforms": _load_midas_transforms,
+    "yolo_objects": lambda: _load_yolo("yolo_objects"),
+    "yolo_cracks": lambda: _load_yolo("yolo_cracks"),
+}
+
+
+def load(name: str):
+    return LOADERS[name]()
+
+
+# ==================== Vendoring ====================
+
+def _vendor_model(name, model, directory) -> dict:
+    """Write one upstream model into `directory`; returns its manifest entry"""
+    entry = {}
+    if name.endswith("_processor"):
+        model.save_pretrained(directory)
+    elif name in ("segformer", "clip"):
+        model.config.save_pretrained(directory)
+        entry["aliases"] = save_tensors(model, os.path.join(directory, WEIGHTS_FILE))
+    elif name == "midas":
+        entry["aliases"] = save_tensors(model, os.path.join(directory, WEIGHTS_FILE))
+    elif name in ("yolo_objects", "yolo_cracks"):
+        # YAML is a superset of JSON, so the architecture dict round-trips as-is
+        with open(os.path.join(directory, "model.yaml"), "w") as f:
+            json.dump(model.model.yaml, f, indent=2)
+        entry["aliases"] = save_tensors(model.model, os.path.join(directory, WEIGHTS_FILE))
+        entry["names"] = {str(k): v for k, v in model.model.names.items()}
+    return entry
+
+
+def _vendor_hub(target):
+    """Copy the torch hub repos and backbone checkpoint MiDaS needs into the store"""
+    import torch
+    hub = torch.hub.get_dir()
+    os.makedirs(os.path.join(target, "checkpoints"), exist_ok=True)
+    for entry in os.listdir(hub):
+        if entry.startswith(_HUB_PREFIXES):
+            shutil.copytree(os.path.join(hub, entry), os.path.join(target, entry), dirs_exist_ok=True)
+    if os.path.exists(os.path.join(hub, "trusted_list")):
+        shutil.copy2(os.path.join(hub, "trusted_list"), os.path.join(target, "trusted_list"))
+    checkpoints = os.path.join(hub, "checkpoints")
+    for entry in os.listdir(checkpoints) if os.path.isdir(checkpoints) else []:
+        if _HUB_CHECKPOINT_HINT in entry:
+            shutil.copy2(os.path.join(checkpoints, entry), os.path.join(target, "checkpoints", entry))
+
+
+def _file_hashes(directory) -> dict:
+    hashes = {}
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            if os.path.relpath(path, directory) == MANIFEST_FILE:
+                continue
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            hashes[os.path.relpath(path, directory).replace(os.sep, "/")] = digest.hexdigest()
+    return hashes
+
+
+def vendor(version=None, names=None):
+    """Load every model from upstream and write it into a new store version"""
+    import torch
+    import model_registry
+
+    version = version or MODEL_STORE_VERSION
+    target = store_path(version=version)
+    staging = target + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    # The registry's own loaders always fetch from upstream, whatever ANALYZER_MODEL_SOURCE says
+    models = {}
+    for name in names or model_registry.MODEL_NAMES:
+        print(f"Vendoring {name}...")
+        directory = os.path.join(staging, name)
+        os.makedirs(directory, exist_ok=True)
+        models[name] = _vendor_model(name, model_registry._loaders[name](), directory)
+        if name.startswith("midas"):
+            _vendor_hub(os.path.join(staging, "hub"))
+
+    import transformers
+    import ultralytics
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "version": version,
+            "created_at": time.time(),
+            "sources": {
+                "segformer": model_registry.SEGFORMER_CHECKPOINT,
+                "clip": model_registry.CLIP_CHECKPOINT,
+                "midas": model_registry.MIDAS_MODEL_TYPE,
+                "yolo_objects": os.path.basename(model_registry.OBJECT_MODEL_PATH),
+                "yolo_cracks": os.path.basename(model_registry.CRACK_MODEL_PATH),
+            },
+            "library_versions": {
+                "torch": torch.__version__,
+                "transformers": transformers.__version__,
+                "ultralytics": ultralytics.__version__,
+            },
+            "models": models,
+            "files": _file_hashes(staging),
+        }, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    _manifests.pop(version, None)
+    print(f"Model store version {version} written to {target}")
+
+
+def verify(version=None) -> list:
+    """Files whose hash differs from the manifest (or that are missing)"""
+    version = version or MODEL_STORE_VERSION
+    expected = (manifest(version) or {}).get("files")
+    if expected is None:
+        raise RuntimeError(f"No model store version {version} at {store_path(version=version)}")
+    actual = _file_hashes(store_path(version=version))
+    return sorted(path for path, digest in expected.items() if actual.get(path) != digest)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor analyzer models into a local safetensors store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    vendor_parser = subparsers.add_parser("vendor", help="Fetch every model into MODEL_STORE_DIR/<version>")
+    vendor_parser.add_argument("--version", help=f"Store version (default: {MODEL_STORE_VERSION})")
+    verify_parser = subparsers.add_parser("verify", help="Check the store's files against its manifest")
+    verify_parser.add_argument("--version", help=f"Store version (default: {MODEL_STORE_VERSION})")
+    args = parser.parse_args()
+
+    if args.command == "vendor":
+        vendor(args.version)
+    else:
+        mismatched = verify(args.version)
+        if mismatched:
+            sys.exit(f"{len(mismatched)} files differ from the manifest: {', '.join(mismatched)}")
+        print("Model store matches its manifest")
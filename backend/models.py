@@ -211,6 +211,31 @@ def init_db():
         )
     """)
     
+    # Background analysis jobs (see analysis_jobs.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id TEXT PRIMARY KEY,
+            property_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'queued',
+            previous_status TEXT,
+            photos_total INTEGER DEFAULT 0,
+            photos_done INTEGER DEFAULT 0,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            worker_pid INTEGER,
+            FOREIGN KEY (property_id) REFERENCES properties(id)
+        )
+    """)
+    # Databases created before jobs recorded the server process running them
+    job_columns = [row["name"] for row in cursor.execute("PRAGMA table_info(analysis_jobs)")]
+    if "worker_pid" not in job_columns:
+        cursor.execute("ALTER TABLE analysis_jobs ADD COLUMN worker_pid INTEGER")
+    
     conn.commit()
     conn.close()
 
@@ -0,0 +1,128 @@
+"""
+VisionEstate - ONNX Runtime Backend
+Exports the analyzer models to ONNX and runs them with ONNX Runtime on CPU.
+
+Export once, then select the backend per model:
+    python onnx_backend.py export                       # every model
+    python onnx_backend.py export --models segformer clip
+    ANALYZER_BACKEND=onnx                               # all models
+    ANALYZER_BACKEND_SEGFORMER=onnx                     # a single model
+Models without an exported file keep running in PyTorch.
+"""
+
+import os
+
+import model_export
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR") or os.path.join(SCRIPT_DIR, "onnx_models")
+ONNX_OPSET = 17
+
+# Registry models that have an ONNX implementation
+ONNX_MODELS = model_export.EXPORT_MODELS
+
+
+def onnx_path(name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, f"{name}.onnx")
+
+
+def _session(path: str):
+    import onnxruntime as ort
+    import torch
+
+    options = ort.SessionOptions()
+    # Follow the thread budget the inference worker gave torch
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _run(session, output, inputs):
+    import torch
+    return torch.from_numpy(session.run([output], {k: v.cpu().numpy() for k, v in inputs.items()})[0])
+
+
+# ==================== Runtime Wrappers ====================
+
+class OnnxSegformer(model_export.ExportedSegformer):
+    backend = "onnx"
+
+    def __init__(self, path):
+        self.session = _session(path)
+
+    def _logits(self, pixel_values):
+        return _run(self.session, "logits", {"pixel_values": pixel_values})
+
+
+class OnnxClip(model_export.ExportedClip):
+    backend = "onnx"
+
+    def __init__(self, vision_path, text_path, meta_path):
+        super().__init__(meta_path)
+        self.vision = _session(vision_path)
+        self.text = _session(text_path)
+
+    def _image_embeds(self, pixel_values):
+        return _run(self.vision, "image_embeds", {"pixel_values": pixel_values})
+
+    def _text_embeds(self, input_ids, attention_mask):
+        return _run(self.text, "text_embeds", {"input_ids": input_ids, "attention_mask": attention_mask})
+
+
+class OnnxMidas:
+    backend = "onnx"
+
+    def __init__(self, path):
+        self.session = _session(path)
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_batch):
+        return _run(self.session, "depth", {"image": input_batch})
+
+
+def load(name: str):
+    """ONNX implementation of a registry model, or None when it has not been exported"""
+    if name == "clip":
+        paths = model_export.clip_paths(ONNX_MODEL_DIR, onnx_path)
+        return OnnxClip(*paths) if all(os.path.exists(p) for p in paths) else None
+
+    path = onnx_path(name)
+    if not os.path.exists(path):
+        return None
+    if name == "segformer":
+        return OnnxSegformer(path)
+    if name == "midas":
+        return OnnxMidas(path)
+    if name in model_export.YOLO_MODELS:
+        from ultralytics import YOLO
+        # Ultralytics runs exported detectors with ONNX Runtime itself
+        return YOLO(path, task="detect")
+    raise KeyError(f"No ONNX backend for model '{name}'")
+
+
+# ==================== Export ====================
+
+def save_graph(graph):
+    import torch
+    # The exporter restores the wrapper's training flag recursively, so it must be in eval mode
+    module = graph.module.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            module, graph.args, onnx_path(graph.name),
+            input_names=graph.inputs, output_names=graph.outputs,
+            dynamic_axes=graph.dynamic_axes, opset_version=ONNX_OPSET, dynamo=False,
+        )
+
+
+def save_yolo(name):
+    model_export.export_yolo(name, onnx_path(name), format="onnx", dynamic=True, opset=ONNX_OPSET)
+
+
+def export_models(names=None):
+    model_export.export_models(ONNX_MODEL_DIR, save_graph, save_yolo, names)
+
+
+if __name__ == "__main__":
+    model_export.main("Export analyzer models to ONNX", ONNX_MODEL_DIR, save_graph, save_yolo)
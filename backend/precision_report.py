@@ -0,0 +1,182 @@
+"""
+VisionEstate - Precision Report
+Measures latency and output drift of the bf16 / int8 precision modes against fp32 on a set of
+reference photos, so a precision can be chosen per model (ANALYZER_PRECISION_<MODEL>).
+
+    python precision_report.py photos/                 # every supported model and mode
+    python precision_report.py a.jpg b.jpg --models clip --modes int8 --json report.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+import torch
+
+import model_registry
+import image_io
+import analyzer
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_reference_images(paths):
+    """RGB working buffers for the given files and directories"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+
+    images = []
+    for path in files:
+        with open(path, "rb") as f:
+            decoded = image_io.decode_bytes(f.read())
+        if decoded is None:
+            print(f"Skipping unreadable image {path}")
+            continue
+        images.append(cv2.cvtColor(decoded.image, cv2.COLOR_BGR2RGB))
+    return images
+
+
+# ==================== Model Runners ====================
+#
+# Each runner returns the model output the analyzer derives its results from.
+
+def run_segformer(imgs_rgb):
+    model = model_registry.get("segformer")
+    pixel_values = analyzer.segformer_pixel_values(imgs_rgb)
+    with torch.no_grad(), model_registry.autocast("segformer"):
+        logits = model(pixel_values=pixel_values).logits
+    return logits.float().numpy()
+
+
+def run_clip(imgs_rgb):
+    return analyzer.classify_room_types(imgs_rgb)
+
+
+def run_midas(imgs_rgb):
+    midas = model_registry.get("midas")
+    transforms = model_registry.get("midas_transforms")
+    device = model_registry.get_device()
+    depths = []
+    for img in imgs_rgb:
+        with torch.no_grad(), model_registry.autocast("midas", device.type):
+            depths.append(midas(transforms.small_transform(img).to(device)).float().cpu().numpy()[0])
+    return depths
+
+
+RUNNERS = {"segformer": run_segformer, "clip": run_clip, "midas": run_midas}
+
+
+# ==================== Drift Metrics ====================
+
+def drift_segformer(reference, output):
+    ref_masks, masks = reference.argmax(axis=1), output.argmax(axis=1)
+    ref_floor, floor = (ref_masks == 3).mean(axis=(1, 2)), (masks == 3).mean(axis=(1, 2))
+    return {
+        "pixel_label_agreement": round(float((ref_masks == masks).mean()), 4),
+        "floor_ratio_max_abs_diff": round(float(np.abs(ref_floor - floor).max()), 4),
+        "logits_max_abs_diff": round(float(np.abs(reference - output).max()), 4),
+    }
+
+
+def drift_clip(reference, output):
+    return {
+        "room_type_agreement": round(float((reference.argmax(axis=1) == output.argmax(axis=1)).mean()), 4),
+        "probability_max_abs_diff": round(float(np.abs(reference - output).max()), 4),
+    }
+
+
+def drift_midas(reference, output):
+    relative = []
+    range_diff = []
+    for ref, out in zip(reference, output):
+        ref_range = float(ref.max() - ref.min()) or 1.0
+        relative.append(float(np.abs(ref - out).mean()) / ref_range)
+        range_diff.append(abs(float(out.max() - out.min()) - ref_range) / ref_range)
+    return {
+        "depth_mean_rel_error": round(float(np.mean(relative)), 4),
+        "depth_range_max_rel_diff": round(float(np.max(range_diff)), 4),
+    }
+
+
+DRIFT = {"segformer": drift_segformer, "clip": drift_clip, "midas": drift_midas}
+
+
+# ==================== Report ====================
+
+def measure(name, precision, imgs_rgb, repeat):
+    """Load a model in the given precision and return (median seconds per image, output)"""
+    os.environ[f"ANALYZER_PRECISION_{name.upper()}"] = precision
+    model_registry.unload(name)
+    model_registry.get(name)
+
+    output = RUNNERS[name](imgs_rgb)  # warm-up run, also the output compared for drift
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        RUNNERS[name](imgs_rgb)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) / len(imgs_rgb), output
+
+
+def precision_report(imgs_rgb, models=None, modes=None, repeat=3) -> dict:
+    """Latency per image and drift against fp32 for each model and precision mode"""
+    report = {"images": len(imgs_rgb), "torch_threads": torch.get_num_threads(), "models": {}}
+    for name in models or list(RUNNERS):
+        if model_registry.backend_for(name) != "torch":
+            print(f"Skipping {name}: precision modes only apply to the torch backend")
+            continue
+
+        baseline_seconds, baseline = measure(name, "fp32", imgs_rgb, repeat)
+        rows = {"fp32": {"ms_per_image": round(baseline_seconds * 1000, 1), "speedup": 1.0}}
+        for precision in modes or model_registry.PRECISION_MODES[name]:
+            if precision == "fp32" or precision not in model_registry.PRECISION_MODES[name]:
+                continue
+            seconds, output = measure(name, precision, imgs_rgb, repeat)
+            rows[precision] = {
+                "ms_per_image": round(seconds * 1000, 1),
+                "speedup": round(baseline_seconds / seconds, 2),
+                **DRIFT[name](baseline, output),
+            }
+        report["models"][name] = rows
+        model_registry.unload(name)
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['images']} reference images, {report['torch_threads']} torch threads")
+    for name, rows in report["models"].items():
+        print(f"\n{name}")
+        for precision, row in rows.items():
+            metrics = ", ".join(f"{key}={value}" for key, value in row.items())
+            print(f"  {precision:5} {metrics}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and output drift of precision modes vs fp32")
+    parser.add_argument("images", nargs="+", help="Reference image files or directories")
+    parser.add_argument("--models", nargs="+", choices=list(RUNNERS), help="Models to measure (default: all)")
+    parser.add_argument("--modes", nargs="+", choices=["bf16", "int8"], help="Modes to compare (default: all supported)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per mode")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    reference_images = load_reference_images(args.images)
+    if not reference_images:
+        sys.exit("No readable reference images")
+
+    result = precision_report(reference_images, args.models, args.modes, args.repeat)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,111 @@
+"""
+VisionEstate - Analysis Result Cache
+Persistent, size-bounded LRU cache of detect_defects results keyed by image content hash.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+from detections import Detections
+from sqlite_cache import CacheDB
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(SCRIPT_DIR, "analysis_cache.db"))
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "256"))
+
+_db = CacheDB(RESULT_CACHE_PATH, [
+    """
+    CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)",
+])
+
+
+def content_key(data: bytes, pipeline_version: str) -> str:
+    """SHA-256 of the image bytes, scoped to the pipeline version that produced the result"""
+    return f"{hashlib.sha256(data).hexdigest()}:{pipeline_version}"
+
+
+def get(key: str):
+    """Cached (detections, spatial_data, is_calibrated, img_size) or None"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+
+    conn = _db.connect()
+    try:
+        row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        _db.increment(conn, "hits" if row else "misses")
+        conn.commit()
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+    value = json.loads(row[0])
+    detections = Detections.from_compact(value["detections"])
+    return detections, value["spatial"], value["calibrated"], value["img_size"]
+
+
+def put(key: str, result):
+    """Store a detect_defects result, evicting least recently used entries beyond the size bound"""
+    if not RESULT_CACHE_ENABLED:
+        return
+
+    detections, spatial, calibrated, img_size = result
+    value = json.dumps({
+        "detections": detections.to_compact(),
+        "spatial": spatial,
+        "calibrated": calibrated,
+        "img_size": img_size,
+    })
+    now = time.time()
+
+    conn = _db.connect()
+    try:
+        conn.execute("""
+            INSERT OR REPLACE INTO results (key, value, size, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, value, len(value), now, now))
+        _evict(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _evict(conn):
+    max_bytes = int(RESULT_CACHE_MAX_MB * 1024 * 1024)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    evicted = 0
+    for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+        if total <= max_bytes:
+            break
+        conn.execute("DELETE FROM results WHERE key = ?", (key,))
+        total -= size
+        evicted += 1
+    _db.increment(conn, "evictions", evicted)
+
+
+def stats() -> dict:
+    """Hit/miss/eviction counters (shared by all worker processes) and current size"""
+    if not RESULT_CACHE_ENABLED:
+        return {"enabled": False}
+    return {**_db.stats("results", counters=("evictions",), size_column="size"), "max_size_mb": RESULT_CACHE_MAX_MB}
+
+
+def clear():
+    _db.clear("results")
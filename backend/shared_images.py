@@ -0,0 +1,117 @@
+"""
+VisionEstate - Shared-Memory Image Transfer
+Moves decoded photos from the API process to the inference server through one
+multiprocessing.shared_memory block per request instead of pickling the pixels.
+
+The API side decodes each photo (image_io, no torch needed) and packs the working buffer,
+plus what the analyzer needs for full-resolution work, into the block. Only a small
+descriptor of offsets and shapes crosses the socket. The server maps the arrays straight
+out of the block.
+"""
+
+import sys
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+import image_io
+
+# Offsets are aligned so every mapped array starts on a cache line
+_ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _read(source):
+    """DecodedImage for a path, encoded bytes or BGR array; None when unreadable"""
+    if isinstance(source, np.ndarray):
+        return image_io.from_array(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return image_io.decode_bytes(bytes(source))
+    try:
+        with open(source, "rb") as f:
+            return image_io.decode_bytes(f.read())
+    except OSError:
+        return None
+
+
+# ==================== API Side ====================
+
+def pack(sources):
+    """
+    Decode `sources` into a new shared memory block.
+    Returns (SharedMemory, descriptor); the caller unlinks the block once the server replied.
+    """
+    arrays = []
+    entries = []
+    offset = 0
+    for source in sources:
+        decoded = _read(source)
+        if decoded is None:
+            entries.append(None)
+            continue
+
+        entry = {"orig_size": list(decoded.orig_size)}
+        # Encoded bytes re-decode to full size and key the result cache; arrays ship in full
+        parts = {"image": decoded.image, "full": decoded._full_image}
+        if decoded.content is not None:
+            parts["data"] = np.frombuffer(decoded.content, np.uint8)
+        for field, array in parts.items():
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array)
+            offset = _aligned(offset)
+            entry[field] = {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+            arrays.append((offset, array))
+            offset += array.nbytes
+        entries.append(entry)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for start, array in arrays:
+        shm.buf[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+    return shm, {"name": shm.name, "entries": entries}
+
+
+# ==================== Server Side ====================
+
+def attach(descriptor):
+    """
+    Map the images of a packed request. Returns (SharedMemory, sources) where each source is an
+    image_io.DecodedImage viewing the block (None for unreadable photos). Every view must be
+    dropped before the block is closed.
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    if sys.version_info < (3, 13):
+        # Attaching registers the block with this process's resource tracker, which would
+        # unlink it on exit; the API side owns it
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    def view(spec):
+        if spec is None:
+            return None
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        return np.frombuffer(shm.buf, dtype, count, spec["offset"]).reshape(spec["shape"])
+
+    sources = []
+    for entry in descriptor["entries"]:
+        if entry is None:
+            sources.append(None)
+            continue
+        data = view(entry.get("data"))
+        sources.append(image_io.DecodedImage(
+            view(entry["image"]), tuple(entry["orig_size"]),
+            data=data, full_image=view(entry.get("full")),
+            content=data.data if data is not None else None,
+        ))
+    return shm, sources
+
+
+def release(shm):
+    """Close an attached block; views still alive keep the mapping until they are collected"""
+    try:
+        shm.close()
+    except BufferError:
+        pass
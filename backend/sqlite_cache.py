@@ -0,0 +1,77 @@
+"""
+VisionEstate - SQLite Cache Storage
+What the persistent caches (result_cache, gemini_cache) share: one SQLite file per cache in WAL
+mode so every process can read while one writes, its tables created on first use, and a
+counters table for hit/miss statistics. Each cache keeps its own schema, keys and policy.
+"""
+
+import sqlite3
+import threading
+
+_COUNTERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+class CacheDB:
+    """A cache's SQLite file; `schema` holds the statements creating its tables and indexes"""
+
+    def __init__(self, path: str, schema: list):
+        self.path = path
+        self.schema = schema
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                # WAL lets inference workers read while another one writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in [*self.schema, _COUNTERS_SCHEMA]:
+                    conn.execute(statement)
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    @staticmethod
+    def increment(conn, name: str, amount: int = 1):
+        conn.execute("""
+            INSERT INTO counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (name, amount))
+
+    def stats(self, table: str, counters=(), size_column: str = None) -> dict:
+        """
+        Entry count (and total size in MB when size_column is given) of table, the hit/miss
+        counters with the hit rate, and the other named counters (shared by all processes)
+        """
+        conn = self.connect()
+        try:
+            values = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            size = f"COALESCE(SUM({size_column}), 0)" if size_column else "0"
+            entries, total = conn.execute(f"SELECT COUNT(*), {size} FROM {table}").fetchone()
+        finally:
+            conn.close()
+
+        hits = values.get("hits", 0)
+        misses = values.get("misses", 0)
+        result = {"enabled": True, "entries": entries}
+        if size_column:
+            result["size_mb"] = round(total / (1024 * 1024), 2)
+        result.update({"hits": hits, "misses": misses})
+        result.update({name: values.get(name, 0) for name in counters})
+        result["hit_rate"] = round(hits / (hits + misses), 3) if hits + misses else 0.0
+        return result
+
+    def clear(self, table: str):
+        conn = self.connect()
+        try:
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute("DELETE FROM counters")
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,103 @@
+"""
+VisionEstate - TorchScript Backend
+Traces the analyzer models once at build time and saves them as frozen TorchScript archives.
+Loading an archive skips building the eager modules (and importing transformers for them),
+and freezing folds weights and batch norms into the graph.
+
+    python torchscript_backend.py export                # every model
+    python torchscript_backend.py export --models midas
+    ANALYZER_BACKEND=torchscript                        # all models
+    ANALYZER_BACKEND_MIDAS=torchscript                  # a single model
+    python backend_benchmark.py photos/                 # cold start and latency vs eager
+Models without an exported archive keep running eagerly.
+"""
+
+import os
+
+import model_export
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TORCHSCRIPT_MODEL_DIR = os.getenv("TORCHSCRIPT_MODEL_DIR") or os.path.join(SCRIPT_DIR, "torchscript_models")
+
+# Registry models that have a TorchScript implementation
+TORCHSCRIPT_MODELS = model_export.EXPORT_MODELS
+
+
+def torchscript_path(name: str) -> str:
+    return os.path.join(TORCHSCRIPT_MODEL_DIR, f"{name}.torchscript")
+
+
+def _load_module(path: str, device="cpu"):
+    import torch
+    return torch.jit.load(path, map_location=device).eval()
+
+
+# ==================== Runtime Wrappers ====================
+
+class TorchScriptSegformer(model_export.ExportedSegformer):
+    backend = "torchscript"
+
+    def __init__(self, path):
+        self.module = _load_module(path)
+
+    def _logits(self, pixel_values):
+        return self.module(pixel_values)
+
+
+class TorchScriptClip(model_export.ExportedClip):
+    backend = "torchscript"
+
+    def __init__(self, vision_path, text_path, meta_path):
+        super().__init__(meta_path)
+        self.vision = _load_module(vision_path)
+        self.text = _load_module(text_path)
+
+    def _image_embeds(self, pixel_values):
+        return self.vision(pixel_values)
+
+    def _text_embeds(self, input_ids, attention_mask):
+        return self.text(input_ids, attention_mask)
+
+
+def load(name: str):
+    """TorchScript implementation of a registry model, or None when it has not been exported"""
+    if name == "clip":
+        paths = model_export.clip_paths(TORCHSCRIPT_MODEL_DIR, torchscript_path)
+        return TorchScriptClip(*paths) if all(os.path.exists(p) for p in paths) else None
+
+    path = torchscript_path(name)
+    if not os.path.exists(path):
+        return None
+    if name == "segformer":
+        return TorchScriptSegformer(path)
+    if name == "midas":
+        import model_registry
+        # A plain module already has the interface the analyzer calls
+        return _load_module(path, model_registry.get_device())
+    if name in model_export.YOLO_MODELS:
+        from ultralytics import YOLO
+        # Ultralytics runs TorchScript detectors itself
+        return YOLO(path, task="detect")
+    raise KeyError(f"No TorchScript backend for model '{name}'")
+
+
+# ==================== Export ====================
+
+def save_graph(graph):
+    """Trace the graph's module on its example inputs, freeze it and save it"""
+    import torch
+    with torch.no_grad():
+        traced = torch.jit.trace(graph.module.eval(), graph.args, strict=False, check_trace=False)
+        torch.jit.freeze(traced).save(torchscript_path(graph.name))
+
+
+def save_yolo(name):
+    model_export.export_yolo(name, torchscript_path(name), format="torchscript")
+
+
+def export_models(names=None):
+    model_export.export_models(TORCHSCRIPT_MODEL_DIR, save_graph, save_yolo, names)
+
+
+if __name__ == "__main__":
+    model_export.main("Export analyzer models to TorchScript", TORCHSCRIPT_MODEL_DIR, save_graph, save_yolo)